@@ -0,0 +1,549 @@
+"""Acquisition helpers built on top of ifxRadarSDK
+
+The wrapper in ifxRadarSDK maps the radar SDK one to one. The classes in this
+module combine its calls into the acquisition patterns used for building the
+dataset and for live classification.
+"""
+
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from ifxError import ErrorFifoOverflow, error_code_for_exception
+from ifxRadarSDK import Device, ShieldType
+
+__all__ = ["AcquisitionWorker", "DeviceSession", "MultiDeviceAcquisition",
+           "DEFAULT_METRICS"]
+
+# metrics used for recording the dataset, rx_mask defaults to all antennas
+DEFAULT_METRICS = {
+    "sample_rate_Hz": 1000000,
+    "range_resolution_m": 0.03,
+    "max_range_m": 0.8,
+    "max_speed_m_s": 2.84,
+    "speed_resolution_m_s": 0.089,
+    "center_frequency_Hz": 0,
+    "tx_mask": 1,
+    "tx_power_level": 4,
+    "if_gain_dB": 40,
+}
+
+_fifo_overflow = error_code_for_exception(ErrorFifoOverflow)
+
+
+class AcquisitionWorker():
+    DROP_OLDEST = "drop_oldest"
+    BLOCK = "block"
+
+    def __init__(self, device, capacity=8, policy=DROP_OLDEST, timeout_ms=1000,
+                 clock=time.monotonic):
+        """Create worker that reads frames from device on its own thread
+
+        The worker drains the device into a ring of capacity preallocated
+        frames, so slow processing in the consumer does not stall the device
+        and does not end in a FIFO overflow of the device.
+
+        If the ring is full, the policy decides what happens to a new frame:
+        with "drop_oldest" the oldest frame in the ring is overwritten, with
+        "block" the worker waits until the consumer took a frame (the device
+        FIFO might overflow in this case).
+
+        The device must be configured before the worker is created. The worker
+        counts produced, consumed and dropped frames as well as FIFO overflows
+        of the device, see stats(). Every frame is stamped with the time given
+        by clock when it was received and with its sequence number, see
+        get_stamped().
+
+        Examples:
+            with AcquisitionWorker(device) as worker:
+                for data in worker:
+                    # data has shape (num_rx, num_chirps, num_samples)
+                    ...
+
+        Parameters:
+            device      configured Device
+            capacity    number of frames in the ring buffer
+            policy      "drop_oldest" or "block"
+            timeout_ms  timeout for reading a single frame from the device
+            clock       function returning the time stamp in seconds
+        """
+        if policy not in (self.DROP_OLDEST, self.BLOCK):
+            raise ValueError("Wrong policy")
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+
+        self.device = device
+        self.policy = policy
+        self.timeout_ms = timeout_ms
+        self.clock = clock
+
+        self._frame = device.create_frame_from_device_handle()
+        shape = self._frame.as_array().shape
+        self._ring = np.empty((capacity,) + shape, dtype=np.float32)
+        self._timestamps = np.zeros(capacity)
+        self._sequence = np.zeros(capacity, dtype=np.int64)
+        self._head = 0  # slot of the oldest frame in the ring
+        self._count = 0  # number of frames in the ring
+
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._error = None
+
+        self.produced = 0
+        self.consumed = 0
+        self.dropped = 0
+        self.overflowed = 0
+
+    @property
+    def frame_shape(self):
+        """Shape (num_rx, num_chirps, num_samples) of the frames"""
+        return self._ring.shape[1:]
+
+    def start(self):
+        """Start the acquisition thread"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the acquisition thread
+
+        Frames that are still in the ring can be read with get() afterwards.
+        """
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _put(self, timestamp):
+        """Copy the current frame into the ring, must hold the lock"""
+        capacity = len(self._ring)
+        if self._count == capacity:
+            if self.policy == self.BLOCK:
+                while self._count == capacity and self._running:
+                    self._cond.wait()
+                if not self._running:
+                    return
+            else:
+                self._head = (self._head + 1) % capacity
+                self._count -= 1
+                self.dropped += 1
+
+        slot = (self._head + self._count) % capacity
+        self._frame.as_array(out=self._ring[slot])
+        self._timestamps[slot] = timestamp
+        self._sequence[slot] = self.produced
+        self._count += 1
+        self.produced += 1
+        self._cond.notify_all()
+
+    def _run(self):
+        device = self.device
+        try:
+            device.start_acquisition()
+            while self._running:
+                rc = device.try_get_next_frame(self._frame, self.timeout_ms)
+                if rc == _fifo_overflow:
+                    # the device stops the acquisition on overflow, restart it
+                    with self._cond:
+                        self.overflowed += 1
+                    device.stop_acquisition()
+                    device.start_acquisition()
+                    continue
+                if rc:
+                    continue
+
+                timestamp = self.clock()
+                with self._cond:
+                    self._put(timestamp)
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+            if device.handle:
+                device.stop_acquisition()
+
+    def _wait(self, timeout):
+        """Wait for a frame, must hold the lock
+
+        Returns True if a frame is in the ring and False if the worker is
+        stopped and the ring is empty.
+        """
+        ready = self._cond.wait_for(lambda: self._count or not self._running, timeout)
+        if not ready:
+            raise TimeoutError("No frame within {} s".format(timeout))
+        if not self._count:
+            if self._error is not None:
+                raise self._error
+            return False
+        return True
+
+    def _pop(self):
+        """Remove the oldest frame from the ring, must hold the lock"""
+        self._head = (self._head + 1) % len(self._ring)
+        self._count -= 1
+        self._cond.notify_all()
+
+    def get_stamped(self, timeout=None, out=None, sequence=None):
+        """Return the oldest frame from the ring with time stamp and sequence number
+
+        Returns the tuple (data, timestamp, sequence) or None, see get().
+
+        If sequence is given (e.g. from peek_stamped), the oldest frame is
+        only returned if it has this sequence number. If it was overwritten
+        in the meantime (policy "drop_oldest"), the ring is not changed and
+        False is returned.
+
+        Parameters:
+            timeout     timeout in seconds; if None, wait forever
+            out         optional array the frame is copied to
+            sequence    expected sequence number of the oldest frame
+        """
+        with self._cond:
+            if not self._wait(timeout):
+                return None
+            if sequence is not None and self._sequence[self._head] != sequence:
+                return False
+
+            frame = self._ring[self._head]
+            if out is None:
+                out = frame.copy()
+            else:
+                np.copyto(out, frame)
+            timestamp = float(self._timestamps[self._head])
+            sequence = int(self._sequence[self._head])
+            self._pop()
+            self.consumed += 1
+            return out, timestamp, sequence
+
+    def get(self, timeout=None, out=None):
+        """Return the oldest frame from the ring
+
+        The frame is returned as a new array of shape frame_shape or, if out
+        is given, copied into out. If no frame arrives within timeout
+        seconds, TimeoutError is raised. If the worker is stopped and the ring
+        is empty, None is returned. An exception raised on the acquisition
+        thread is re-raised here.
+
+        Parameters:
+            timeout     timeout in seconds; if None, wait forever
+            out         optional array the frame is copied to
+        """
+        stamped = self.get_stamped(timeout, out)
+        return None if stamped is None else stamped[0]
+
+    def peek_stamped(self, timeout=None):
+        """Return (timestamp, sequence) of the oldest frame without removing it
+
+        Returns None if the worker is stopped and the ring is empty.
+
+        Parameters:
+            timeout     timeout in seconds; if None, wait forever
+        """
+        with self._cond:
+            if not self._wait(timeout):
+                return None
+            return float(self._timestamps[self._head]), int(self._sequence[self._head])
+
+    def peek_timestamp(self, timeout=None):
+        """Return the time stamp of the oldest frame without removing it, see peek_stamped"""
+        stamped = self.peek_stamped(timeout)
+        return None if stamped is None else stamped[0]
+
+    def skip(self, sequence=None):
+        """Discard the oldest frame of the ring, it is counted as dropped
+
+        If sequence is given, the oldest frame is only discarded if it has
+        this sequence number.
+        """
+        with self._cond:
+            if self._count and (sequence is None or self._sequence[self._head] == sequence):
+                self._pop()
+                self.dropped += 1
+
+    def stats(self):
+        """Return the frame counters as dictionary"""
+        with self._cond:
+            return {"produced": self.produced,
+                    "consumed": self.consumed,
+                    "dropped": self.dropped,
+                    "overflowed": self.overflowed,
+                    "buffered": self._count}
+
+    def __iter__(self):
+        while True:
+            data = self.get()
+            if data is None:
+                return
+            yield data
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class DeviceSession():
+    def __init__(self, uuid=None, port=None, timeout_ms=1000, **metrics):
+        """Open a device and keep it open and configured across captures
+
+        Opening and configuring a device takes much longer than acquiring a
+        frame. A session opens the device once and configures it with the
+        given metrics (DEFAULT_METRICS if none are given). Translated
+        configurations are cached per metrics and the configuration is only
+        uploaded to the device if it differs from the current one.
+
+        Examples:
+            with DeviceSession() as session:
+                data = session.capture()
+
+        Parameters:
+            uuid        open the radar device with the given uuid, see Device
+            port        open the given port, see Device
+            timeout_ms  timeout for acquiring a frame
+            metrics     metrics as accepted by Device.translate_metrics_to_config
+        """
+        self.device = Device(uuid=uuid, port=port)
+        self.timeout_ms = timeout_ms
+        num_rx_antennas = self.device.get_device_information()["num_rx_antennas"]
+        self.rx_mask = (1 << num_rx_antennas) - 1
+
+        self._configs = {}
+        self._frame = None
+        self.config = None
+        self.configure(**(metrics or DEFAULT_METRICS))
+
+    def _is_configured(self, config):
+        """Return True if config is the current configuration of the device"""
+        current = self.device.get_config()
+        current["mimo_mode"] = Device._mimo_c_val_2_str(current["mimo_mode"])
+        return current == config
+
+    def configure(self, **metrics):
+        """Configure the device according to metrics
+
+        If rx_mask is not given, all RX antennas are activated.
+
+        Parameters:
+            metrics     metrics as accepted by Device.translate_metrics_to_config
+        """
+        metrics.setdefault("rx_mask", self.rx_mask)
+        key = tuple(sorted(metrics.items()))
+        config = self._configs.get(key)
+        if config is None:
+            config = self.device.translate_metrics_to_config(**metrics)
+            self._configs[key] = config
+
+        if not self._is_configured(config):
+            self.device.set_config(**config)
+            # set_config starts the acquisition, captures start it themselves
+            self.device.stop_acquisition()
+            self._frame = None
+        self.config = config
+
+    def capture(self, out=None):
+        """Acquire one frame
+
+        The acquisition is started for the capture only, so the frame is
+        acquired after the call and not taken from a stale device FIFO.
+
+        Returns an array of shape (num_rx, num_chirps, num_samples) or out if
+        given.
+
+        Parameters:
+            out     optional array the frame is copied to
+        """
+        if self._frame is None:
+            self._frame = self.device.create_frame_from_device_handle()
+
+        self.device.start_acquisition()
+        try:
+            self.device.get_next_frame(self._frame, self.timeout_ms)
+        finally:
+            self.device.stop_acquisition()
+        return self._frame.as_array(copy=out is None, out=out)
+
+    def capture_burst(self, n_frames, out=None):
+        """Acquire n_frames consecutive frames in one acquisition run
+
+        Returns an array of shape (n_frames, num_rx, num_chirps, num_samples)
+        or out if given.
+
+        Parameters:
+            n_frames    number of frames
+            out         optional array the frames are copied to
+        """
+        if self._frame is None:
+            self._frame = self.device.create_frame_from_device_handle()
+        return self.device.get_frames(n_frames, self.timeout_ms, out, self._frame)
+
+    def save_burst(self, directory, n_frames):
+        """Acquire n_frames frames and save them as one .npy file
+
+        The file is named by a random uuid like the single frame captures.
+        Returns the path of the written file.
+
+        Parameters:
+            directory   directory the file is written to, created if missing
+            n_frames    number of frames
+        """
+        data = self.capture_burst(n_frames)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, str(uuid.uuid4()) + ".npy")
+        np.save(path, data)
+        return path
+
+    def close(self):
+        """Close the device"""
+        self._frame = None
+        self.device.__del__()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class MultiDeviceAcquisition():
+    def __init__(self, uuids=None, shield_type=ShieldType.BGT60TR13AIP,
+                 capacity=8, tolerance_s=None, timeout_ms=1000, **metrics):
+        """Acquire frames from several devices at the same time
+
+        Every device is opened, configured with the same metrics and read by
+        its own AcquisitionWorker. The SDK calls release the GIL, so the
+        devices are read in parallel. All frames are stamped with the same
+        monotonic clock. get() combines the frames of all devices whose time
+        stamps are within tolerance_s into one aligned tuple; frames without
+        partner frames from all other devices are dropped.
+
+        Examples:
+            with MultiDeviceAcquisition() as acquisition:
+                for timestamps, frames in acquisition:
+                    # frames[i] is the frame of device acquisition.uuids[i]
+                    ...
+
+        Parameters:
+            uuids       uuids of the devices; if None, all devices of
+                        shield_type found by Device.get_list are opened
+            shield_type shield type used to search for devices
+            capacity    number of frames buffered per device
+            tolerance_s maximum time stamp difference of aligned frames; if
+                        None, half the frame repetition time is used
+            timeout_ms  timeout for reading a single frame from a device
+            metrics     metrics as accepted by Device.translate_metrics_to_config
+        """
+        if uuids is None:
+            uuids = Device.get_list(shield_type)
+        if not uuids:
+            raise ValueError("No devices found")
+
+        self.uuids = list(uuids)
+        self.sessions = []
+        self.workers = []
+        try:
+            for uuid in self.uuids:
+                session = DeviceSession(uuid=uuid, timeout_ms=timeout_ms, **metrics)
+                self.sessions.append(session)
+                self.workers.append(AcquisitionWorker(session.device, capacity,
+                                                      timeout_ms=timeout_ms))
+        except Exception:
+            self.close()
+            raise
+
+        if tolerance_s is None:
+            tolerance_s = self.sessions[0].config["frame_repetition_time_s"] / 2
+        self.tolerance_s = tolerance_s
+        self.aligned = 0
+        self.misaligned = 0
+
+    def start(self):
+        """Start acquisition on all devices"""
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        """Stop acquisition on all devices"""
+        for worker in self.workers:
+            worker.stop()
+
+    def close(self):
+        """Stop acquisition and close all devices"""
+        self.stop()
+        for session in self.sessions:
+            session.close()
+
+    def get(self, timeout=None):
+        """Return the next aligned frames of all devices
+
+        Returns the tuple (timestamps, frames) where timestamps and frames are
+        lists with one entry per device, in the order of uuids. Returns None
+        if a worker is stopped and has no frames left.
+
+        Parameters:
+            timeout     timeout in seconds for waiting for a single frame
+        """
+        while True:
+            peeked = [worker.peek_stamped(timeout) for worker in self.workers]
+            if None in peeked:
+                return None
+
+            newest = max(timestamp for timestamp, _ in peeked)
+            late = [(worker, sequence) for worker, (timestamp, sequence) in zip(self.workers, peeked)
+                    if newest - timestamp > self.tolerance_s]
+            if late:
+                for worker, sequence in late:
+                    worker.skip(sequence)
+                    self.misaligned += 1
+                continue
+
+            # take exactly the peeked frames; a worker can overwrite its oldest
+            # frame (drop_oldest) between peeking and taking
+            stamped = []
+            for worker, (_, sequence) in zip(self.workers, peeked):
+                frame = worker.get_stamped(timeout, sequence=sequence)
+                if not frame:
+                    break
+                stamped.append(frame)
+            else:
+                self.aligned += 1
+                return [timestamp for _, timestamp, _ in stamped], [data for data, _, _ in stamped]
+            if frame is None:
+                return None
+            # the frames taken so far have no partners, align again
+            self.misaligned += len(stamped)
+
+    def stats(self):
+        """Return the counters of all devices as dictionary"""
+        return {"aligned": self.aligned,
+                "misaligned": self.misaligned,
+                "devices": dict((uuid, worker.stats())
+                                for uuid, worker in zip(self.uuids, self.workers))}
+
+    def __iter__(self):
+        while True:
+            aligned = self.get()
+            if aligned is None:
+                return
+            yield aligned
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
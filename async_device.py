@@ -0,0 +1,158 @@
+"""asyncio interface for ifxRadarSDK devices
+
+The calls into the radar SDK block until the device answers, for
+get_next_frame up to a full frame period. AsyncDevice runs all SDK calls of a
+device on one dedicated executor thread, so an asyncio event loop can serve
+other tasks while frames are acquired.
+
+Example:
+    async with AsyncDevice() as device:
+        await device.configure(**DEFAULT_METRICS)
+        async for data in device.frames():
+            ...
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from acquisition import DEFAULT_METRICS
+from ifxRadarSDK import Device
+
+__all__ = ["AsyncDevice"]
+
+
+class AsyncDevice():
+    def __init__(self, uuid=None, port=None, timeout_ms=1000):
+        """Create asyncio wrapper for a device
+
+        The device is opened by open() (or by entering an async with block).
+        All SDK calls are executed in order on a single executor thread.
+
+        Cancelling a coroutine of this class does not interrupt an SDK call
+        that is already running on the executor thread: the call finishes
+        (at the latest after timeout_ms for frame reads) and its result is
+        discarded. Following calls wait for it.
+
+        Parameters:
+            uuid        open the radar device with the given uuid, see Device
+            port        open the given port, see Device
+            timeout_ms  default timeout for reading a frame
+        """
+        self.uuid = uuid
+        self.port = port
+        self.timeout_ms = timeout_ms
+        self.device = None
+        self.config = None
+        self._frame = None
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="radar")
+
+    async def _call(self, func, *args):
+        """Run func(*args) on the executor thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def open(self):
+        """Open the device"""
+        if self.device is None:
+            self.device = await self._call(Device, self.uuid, self.port)
+
+    def _configure(self, metrics):
+        num_rx_antennas = self.device.get_device_information()["num_rx_antennas"]
+        metrics.setdefault("rx_mask", (1 << num_rx_antennas) - 1)
+        config = self.device.translate_metrics_to_config(**metrics)
+        self.device.set_config(**config)
+        self._frame = self.device.create_frame_from_device_handle()
+        return config
+
+    async def configure(self, **metrics):
+        """Configure the device according to metrics and return the configuration
+
+        If no metrics are given, DEFAULT_METRICS are used. If rx_mask is not
+        given, all RX antennas are activated.
+
+        Parameters:
+            metrics     metrics as accepted by Device.translate_metrics_to_config
+        """
+        await self.open()
+        self.config = await self._call(self._configure, dict(metrics or DEFAULT_METRICS))
+        return self.config
+
+    def _read(self, timeout_ms, out):
+        if self._frame is None:
+            self._frame = self.device.create_frame_from_device_handle()
+        self.device.get_next_frame(self._frame, timeout_ms)
+        return self._frame.as_array(copy=out is None, out=out)
+
+    async def get_next_frame(self, timeout_ms=None, out=None):
+        """Retrieve next frame of time domain data from the device
+
+        The device is opened if needed. Returns a new array of shape
+        (num_rx, num_chirps, num_samples) or out if given. If no frame is acquired within timeout_ms milliseconds,
+        ErrorTimeout is raised.
+
+        Parameters:
+            timeout_ms  timeout in milliseconds; if None, timeout_ms given to
+                        the constructor is used
+            out         optional array the frame is copied to
+        """
+        if timeout_ms is None:
+            timeout_ms = self.timeout_ms
+        await self.open()
+        return await self._call(self._read, timeout_ms, out)
+
+    async def frames(self, n_frames=None, timeout_ms=None):
+        """Yield consecutive frames as arrays
+
+        The device is opened if needed and the acquisition is started once.
+        While the caller processes a frame, the next frame is already read on
+        the executor thread. The acquisition is stopped when n_frames frames
+        have been yielded or when the generator is closed.
+
+        Parameters:
+            n_frames    number of frames; if None, frames are read until the
+                        generator is closed
+            timeout_ms  timeout for each frame, see get_next_frame
+        """
+        if timeout_ms is None:
+            timeout_ms = self.timeout_ms
+        await self.open()
+        await self._call(self.device.start_acquisition)
+        pending = None
+        try:
+            frame_number = 0
+            while n_frames is None or frame_number < n_frames:
+                if pending is None:
+                    pending = asyncio.ensure_future(self._call(self._read, timeout_ms, None))
+                data = await pending
+                pending = None
+                frame_number += 1
+                if n_frames is None or frame_number < n_frames:
+                    pending = asyncio.ensure_future(self._call(self._read, timeout_ms, None))
+                yield data
+        finally:
+            if pending is not None:
+                pending.cancel()
+            if self.device is not None:
+                await self._call(self.device.stop_acquisition)
+
+    def _close(self):
+        self._frame = None
+        if self.device is not None:
+            self.device.__del__()
+            self.device = None
+
+    async def close(self):
+        """Close the device and shut down the executor thread (only once)"""
+        if self._closed:
+            return
+        self._closed = True
+        await self._call(self._close)
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
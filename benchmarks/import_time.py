@@ -0,0 +1,51 @@
+"""Measure the time to import modules in a fresh interpreter
+
+Every module is imported --repeat times, each time in a new Python process,
+and the fastest and the median import time are reported. numpy is measured
+as a baseline because ifxRadarSDK depends on it.
+
+Usage:
+    python benchmarks/import_time.py [--repeat N] [module ...]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_snippet = """
+import time
+t = time.perf_counter()
+import {module}
+print(time.perf_counter() - t)
+"""
+
+
+def import_time(module, repeat):
+    """Return list of import times of module in seconds"""
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", _snippet.format(module=module)],
+                             cwd=ROOT, check=True, capture_output=True, text=True).stdout
+        times.append(float(out))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("modules", nargs="*", default=["numpy", "ifxError", "ifxRadarSDK"])
+    args = parser.parse_args()
+
+    print("{:<16} {:>10} {:>10}".format("module", "min [ms]", "median [ms]"))
+    for module in args.modules:
+        times = import_time(module, args.repeat)
+        print("{:<16} {:>10.1f} {:>10.1f}".format(
+            module, 1e3 * min(times), 1e3 * statistics.median(times)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Measure loading a class folder tree with BulkLoader
+
+The notebooks load the samples with a list comprehension of np.load calls.
+This script compares it to BulkLoader with different numbers of threads and
+reports files/s and MB/s. Only the first run of a tree is a cold cache read;
+drop the page cache between runs to measure the storage.
+
+Usage:
+    python benchmarks/load_time.py [--workers N ...] [root ...]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from dataset import BulkLoader  # noqa: E402
+
+
+def load_serial(loader):
+    """Load the files of loader like the notebooks, return (seconds, bytes)"""
+    t_start = time.perf_counter()
+    X = np.array([np.load(f) for f in loader.files])
+    return time.perf_counter() - t_start, X.nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("roots", nargs="*", default=[str(ROOT / "new_new_data")])
+    args = parser.parse_args()
+
+    loader = BulkLoader(args.roots)
+    print("{:<16} {:>10} {:>10}".format("loader", "files/s", "MB/s"))
+    seconds, nbytes = load_serial(loader)
+    print("{:<16} {:>10.0f} {:>10.1f}".format("np.load", len(loader) / seconds, nbytes / 1e6 / seconds))
+    for workers in args.workers:
+        loader.max_workers = workers
+        loader.load()
+        print("{:<16} {:>10.0f} {:>10.1f}".format(
+            "{} threads".format(workers), loader.stats["files_per_s"], loader.stats["mb_per_s"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Compare the NumPy and the torchaudio spectrogram backends
+
+For every parameter set, the spectrograms of the samples of a class folder
+tree are computed with torchaudio.transforms.Spectrogram and with
+NumpySpectrogram. The script reports the maximum difference of the float
+spectrograms relative to their maximum, the fraction of equal uint8 features
+of SpectrogramEngine and the time of both backends.
+
+It exits with status 1 if the difference exceeds --rtol or if the uint8
+features of the train.ipynb setting (no scale) are not all equal. With a
+scale (xgb.ipynb), torchaudio computes in float32, so a few uint8 features
+next to an integer boundary may differ by one. The import times of the
+backends are measured with benchmarks/import_time.py.
+
+Usage:
+    python benchmarks/stft_parity.py [--rtol R] [root ...]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from dataset import BulkLoader  # noqa: E402
+from features import NumpySpectrogram, SpectrogramEngine  # noqa: E402
+
+# (n_fft, win_length, freq_crop, scale) of train.ipynb and xgb.ipynb
+PARAMETER_SETS = [(64, 12, 10, None), (32, 24, 3, 5)]
+# the uint8 features of these parameter sets must be equal
+EXACT_SETS = [(64, 12, 10, None)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rtol", type=float, default=1e-5)
+    parser.add_argument("roots", nargs="*", default=[str(ROOT / "new_new_data")])
+    args = parser.parse_args()
+
+    import torch
+    import torchaudio
+
+    X, _ = BulkLoader(args.roots).load()
+    print("{:<12} {:>10} {:>10} {:>10} {:>10}".format(
+        "n_fft/win", "max diff", "uint8 eq", "torch [ms]", "numpy [ms]"))
+    failed = False
+    for n_fft, win_length, freq_crop, scale in PARAMETER_SETS:
+        reference = torchaudio.transforms.Spectrogram(n_fft=n_fft, win_length=win_length)(
+            torch.from_numpy(X)).numpy()
+        spec = NumpySpectrogram(n_fft, win_length)(X)
+        rdiff = np.max(np.abs(spec - reference)) / np.max(reference)
+        failed |= rdiff > args.rtol
+
+        features, times = [], []
+        for backend in ("torch", "numpy"):
+            engine = SpectrogramEngine(n_fft, win_length, freq_crop=freq_crop, scale=scale, backend=backend)
+            t_start = time.perf_counter()
+            features.append(engine.transform(X))
+            times.append(time.perf_counter() - t_start)
+        equal = np.mean(features[0] == features[1])
+        if (n_fft, win_length, freq_crop, scale) in EXACT_SETS:
+            failed |= equal < 1.0
+        print("{:<12} {:>10.2e} {:>10.5f} {:>10.1f} {:>10.1f}".format(
+            "{}/{}".format(n_fft, win_length), rdiff, equal, 1e3 * times[0], 1e3 * times[1]))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Check the missed frame detection of AcquisitionTelemetry
+
+Runs the replay backend (see simulator.ReplayBackend) at a 10 ms frame
+period with an 8 frame FIFO:
+
+    slow consumer   the consumer sleeps 30 ms every 4th frame; the FIFO
+                    holds the frames, so no frame may be reported missed
+    lost frames     the simulated device skips frames without an overflow;
+                    the skipped frames must be reported missed
+
+The script prints the telemetry counters of both cases and exits with
+status 1 if a check fails.
+
+Usage:
+    python benchmarks/telemetry_gaps.py [--frames N]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import ifxRadarSDK as sdk  # noqa: E402
+from acquisition import DEFAULT_METRICS  # noqa: E402
+from simulator import ReplayBackend  # noqa: E402
+from telemetry import AcquisitionTelemetry  # noqa: E402
+
+FRAME_PERIOD_S = 0.01
+
+
+def run(n_frames, on_frame):
+    """Stream n_frames frames with telemetry, call on_frame(i, backend) after every frame"""
+    backend = ReplayBackend(frame_rate=1 / FRAME_PERIOD_S, fifo_frames=8)
+    sdk.set_backend(backend)
+    try:
+        device = sdk.Device()
+        device.set_config(**device.translate_metrics_to_config(**DEFAULT_METRICS, rx_mask=7))
+        telemetry = AcquisitionTelemetry(frame_period_s=FRAME_PERIOD_S, temperature_interval_s=None)
+        device.set_telemetry(telemetry)
+        for i, frame in enumerate(device.stream(n_frames)):
+            on_frame(i, backend)
+    finally:
+        sdk.set_backend(None)
+    return telemetry.snapshot()
+
+
+def slow_consumer(i, backend):
+    if i % 4 == 3:
+        time.sleep(3 * FRAME_PERIOD_S)
+
+
+def skip_frames(i, backend):
+    # every 5th frame the device drops the next two frames
+    if i % 5 == 4:
+        for device in backend._devices.values():
+            device.num_read += 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=20)
+    args = parser.parse_args()
+
+    failed = False
+    # frames dropped after the last frame are never noticed
+    expected_lost = 2 * len([i for i in range(args.frames - 1) if i % 5 == 4])
+    for name, on_frame, expected in (("slow consumer", slow_consumer, 0),
+                                     ("lost frames", skip_frames, expected_lost)):
+        snapshot = run(args.frames, on_frame)
+        ok = snapshot["missed_frames"] == expected and snapshot["fifo_overflows"] == 0
+        failed |= not ok
+        print("{:<14} frames={} sequence={} gaps={} missed_frames={} (expected {}) fifo_overflows={} {}".format(
+            name, snapshot["frames"], snapshot["sequence"], snapshot["gaps"], snapshot["missed_frames"],
+            expected, snapshot["fifo_overflows"], "ok" if ok else "FAILED"))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
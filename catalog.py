@@ -0,0 +1,264 @@
+"""Catalog over several dataset roots
+
+The recorded corpora (data/, new_data/, new_new_data/, test_data/) use
+different class names for the same materials, e.g. Obuolys in new_new_data
+and apple in new_data. DatasetCatalog registers any number of roots, either
+class folder trees or packed datasets (see dataset.pack_dataset), and maps
+their class names to canonical classes with LABEL_ALIASES.
+
+A CatalogView is a lazy concatenation of the selected samples of all roots.
+Nothing is loaded when a view is created; samples are read when they are
+indexed. Contiguous ranges of a packed dataset are returned as memory mapped
+views without copying (unless the dataset is stored with a codec).
+
+Example:
+    catalog = DatasetCatalog()
+    catalog.add("new_data")
+    catalog.add("packed/new_new_data")
+    view = catalog.view(classes=["apple", "coke", "water"])
+    X, y = view.load()
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from dataset import PackedDataset, list_class_folders, read_npy_into
+
+__all__ = ["DatasetCatalog", "CatalogView", "LABEL_ALIASES"]
+
+# class folder names mapped to the canonical (English) class names
+LABEL_ALIASES = {"Apelsinas": "orange",
+                 "CocaCola": "coke",
+                 "Kefyras": "kefir",
+                 "Obuolys": "apple",
+                 "Pomidoras": "tomato",
+                 "Vanduo": "water"}
+
+
+class _FolderSource():
+    """Class folder tree, every sample is read from its own .npy file"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.files = []
+        self.class_names = []
+        for name, files in list_class_folders(self.root):
+            self.files.extend(files)
+            self.class_names.extend([name] * len(files))
+        if not self.files:
+            raise ValueError("No samples found in {}".format(self.root))
+        first = np.load(self.files[0], mmap_mode="r")
+        self.shape = first.shape
+        self.dtype = first.dtype
+
+    def __len__(self):
+        return len(self.files)
+
+    def read(self, indices, out):
+        for i, index in enumerate(indices):
+            read_npy_into(self.files[index], out[i])
+
+    def item(self, index):
+        return np.load(self.files[index], mmap_mode="r")
+
+    def slice(self, start, stop):
+        return None
+
+
+class _PackedSource():
+    """Packed dataset, samples are read from one memory map"""
+
+    def __init__(self, path):
+        self.dataset = PackedDataset(path)
+        self.root = self.dataset.path
+        self.class_names = list(self.dataset.label_names())
+        self.shape = self.dataset.shape
+        self.dtype = self.dataset.dtype
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def read(self, indices, out):
+        out[:] = self.dataset.read(indices)
+
+    def item(self, index):
+        return self.dataset.read(index)
+
+    def slice(self, start, stop):
+        # quantized samples have to be decoded, there is no view
+        if self.dataset.codec is not None:
+            return None
+        return self.dataset.samples[start:stop]
+
+
+class DatasetCatalog():
+    def __init__(self, aliases=LABEL_ALIASES):
+        """Create empty catalog
+
+        Parameters:
+            aliases     dictionary mapping class folder names to canonical
+                        class names; names not in aliases are used as they are
+        """
+        self.aliases = dict(aliases)
+        self.sources = []
+        self.names = []
+
+    def canonical(self, name):
+        """Return the canonical class name of a class folder name"""
+        return self.aliases.get(name, name)
+
+    def add(self, root, name=None):
+        """Register a class folder tree or a packed dataset
+
+        A directory containing meta.json is opened as packed dataset. All
+        roots must contain samples of the same shape and dtype.
+
+        Parameters:
+            root    directory of the class folder tree or packed dataset
+            name    name of the root used for selecting it in view();
+                    default: the directory path
+        """
+        root = Path(root)
+        source = _PackedSource(root) if (root / "meta.json").exists() else _FolderSource(root)
+        if self.sources and (source.shape, source.dtype) != (self.sources[0].shape, self.sources[0].dtype):
+            raise ValueError("{} has samples of shape {} and dtype {}, expected {} and {}".format(
+                root, source.shape, source.dtype, self.sources[0].shape, self.sources[0].dtype))
+        source.labels = np.array([self.canonical(n) for n in source.class_names])
+        self.sources.append(source)
+        self.names.append(str(root) if name is None else name)
+        return self
+
+    @property
+    def classes(self):
+        """Sorted canonical class names of all registered roots"""
+        return sorted(set().union(*(source.labels.tolist() for source in self.sources)))
+
+    def counts(self):
+        """Return dictionary of canonical class name to number of samples per root"""
+        counts = {}
+        for name, source in zip(self.names, self.sources):
+            labels, n = np.unique(source.labels, return_counts=True)
+            counts[name] = dict(zip(labels.tolist(), n.tolist()))
+        return counts
+
+    def view(self, roots=None, classes=None):
+        """Return a CatalogView of the selected samples
+
+        Labels of the view are indices into classes (default: all classes of
+        the catalog), so views of different roots selected with the same
+        classes have compatible labels.
+
+        Parameters:
+            roots       names of the roots to include (default: all)
+            classes     canonical class names to include (default: all)
+        """
+        classes = self.classes if classes is None else list(classes)
+        class_index = dict((c, i) for i, c in enumerate(classes))
+        parts = []
+        for name, source in zip(self.names, self.sources):
+            if roots is not None and name not in roots:
+                continue
+            selected = np.isin(source.labels, classes)
+            indices = np.flatnonzero(selected)
+            if len(indices):
+                labels = np.array([class_index[c] for c in source.labels[indices]], dtype=np.int16)
+                parts.append((name, source, indices, labels))
+        return CatalogView(classes, parts)
+
+
+class CatalogView():
+    def __init__(self, classes, parts):
+        """Lazy concatenation of samples of several roots, see DatasetCatalog.view
+
+        Parameters:
+            classes     class names the labels index into
+            parts       list of (root name, source, sample indices, labels)
+        """
+        self.classes = classes
+        self.parts = parts
+        self.offsets = np.cumsum([0] + [len(indices) for _, _, indices, _ in parts])
+        self.labels = (np.concatenate([labels for _, _, _, labels in parts])
+                       if parts else np.empty(0, dtype=np.int16))
+        self.shape = parts[0][1].shape if parts else None
+        self.dtype = parts[0][1].dtype if parts else None
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def _locate(self, index):
+        part = int(np.searchsorted(self.offsets, index, side="right")) - 1
+        return part, index - self.offsets[part]
+
+    def root_of(self, index):
+        """Return the root name of a sample"""
+        return self.parts[self._locate(index)[0]][0]
+
+    def __getitem__(self, index):
+        """Return (samples, labels) for an index, slice or index array
+
+        A single sample and a contiguous slice of one packed dataset are
+        returned as memory mapped views, everything else (and samples stored
+        with a codec) is read into a new array.
+        """
+        if isinstance(index, (int, np.integer)):
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError("index {} out of range".format(index))
+            part, local = self._locate(index)
+            _, source, indices, labels = self.parts[part]
+            return source.item(indices[local]), labels[local]
+
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1 and stop > start:
+                part, local = self._locate(start)
+                _, source, indices, _ = self.parts[part]
+                end = local + stop - start
+                if end <= len(indices) and indices[end - 1] - indices[local] == end - 1 - local:
+                    view = source.slice(indices[local], indices[end - 1] + 1)
+                    if view is not None:
+                        return view, self.labels[start:stop]
+            index = np.arange(start, stop, step)
+        return self.load(index)
+
+    def load(self, index=None, out=None):
+        """Read samples into memory and return (X, y)
+
+        Parameters:
+            index   index array or boolean mask (default: all samples)
+            out     optional preallocated array of shape (len(index),) + shape
+        """
+        index = np.arange(len(self)) if index is None else np.asarray(index)
+        if index.dtype == bool:
+            index = np.flatnonzero(index)
+        index = np.where(index < 0, index + len(self), index)
+        if out is None:
+            out = np.empty((len(index),) + tuple(self.shape), dtype=self.dtype)
+
+        part_of = np.searchsorted(self.offsets, index, side="right") - 1
+        for part in np.unique(part_of):
+            _, source, indices, _ = self.parts[part]
+            positions = np.flatnonzero(part_of == part)
+            source.read(indices[index[positions] - self.offsets[part]], _Rows(out, positions))
+        return out, self.labels[index]
+
+    def label_names(self, labels=None):
+        """Return class names for the labels (default: of all samples)"""
+        labels = self.labels if labels is None else labels
+        return np.array(self.classes)[labels]
+
+
+class _Rows():
+    """Write access to selected rows of an array, for reading in place"""
+
+    def __init__(self, array, rows):
+        self.array = array
+        self.rows = rows
+
+    def __getitem__(self, i):
+        return self.array[self.rows[i]]
+
+    def __setitem__(self, key, value):
+        self.array[self.rows[key]] = value
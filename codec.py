@@ -0,0 +1,123 @@
+"""Quantized storage of radar samples
+
+The radar samples are stored as float32 although they are 12-bit ADC codes
+divided by 4095. QuantizedCodec stores them as int16 or float16 with a scale
+and offset:
+
+    stored = (x - offset) / scale       (rounded for int16)
+    x      = stored * scale + offset
+
+which halves the size on disk and in memory. QuantizedCodec.adc() reproduces
+the ADC codes exactly (the reconstruction error is only the float32 rounding
+of the division); fit() derives scale and offset from the data, e.g. per
+shard of a recording.
+
+Example:
+    codec = QuantizedCodec.adc()
+    stored = codec.encode(X)
+    error = codec.measure_error(X, stored)
+    X = codec.decode(stored)
+"""
+
+import numpy as np
+
+__all__ = ["QuantizedCodec", "ADC_BITS"]
+
+ADC_BITS = 12
+
+_int16_max = np.iinfo(np.int16).max
+
+
+class QuantizedCodec():
+    def __init__(self, dtype="int16", scale=None, offset=0.0, out_dtype=np.float32):
+        """Create codec
+
+        If scale is None, fit() has to be called before encoding.
+
+        Parameters:
+            dtype       stored dtype, "int16" or "float16"
+            scale       step between stored values (int16) or normalization
+                        factor (float16)
+            offset      value stored as 0
+            out_dtype   dtype of decoded arrays
+        """
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.dtype(np.int16), np.dtype(np.float16)):
+            raise ValueError("Unsupported codec dtype {}".format(self.dtype))
+        self.scale = scale
+        self.offset = offset
+        self.out_dtype = np.dtype(out_dtype)
+
+    @classmethod
+    def adc(cls, bits=ADC_BITS):
+        """Return int16 codec storing samples in [0, 1] as the codes of a bits-bit ADC"""
+        return cls("int16", scale=1.0 / (2 ** bits - 1), offset=0.0)
+
+    def fit(self, x):
+        """Set scale and offset so the range of x uses the full stored range
+
+        Returns a new codec, self is not modified.
+        """
+        lo, hi = float(np.min(x)), float(np.max(x))
+        offset = (lo + hi) / 2
+        half_range = (hi - lo) / 2 or 1.0
+        if self.dtype == np.int16:
+            scale = half_range / _int16_max
+        else:
+            scale = half_range
+        return QuantizedCodec(self.dtype, scale, offset, self.out_dtype)
+
+    @property
+    def error_bound(self):
+        """Upper bound of the absolute reconstruction error for values in the fitted range
+
+        Float rounding of the decoded values is not included.
+        """
+        if self.dtype == np.int16:
+            return self.scale / 2
+        # float16 has an 11 bit significand, values are normalized to [-1, 1]
+        return self.scale * 2.0 ** -11
+
+    def encode(self, x, out=None):
+        """Return x in the stored dtype (or write it to out)"""
+        if self.scale is None:
+            raise ValueError("Codec has no scale, call fit() first")
+        normalized = (np.asarray(x, dtype=np.float64) - self.offset) / self.scale
+        if self.dtype == np.int16:
+            normalized = np.rint(normalized, out=normalized)
+            np.clip(normalized, -_int16_max - 1, _int16_max, out=normalized)
+        if out is None:
+            return normalized.astype(self.dtype)
+        out[...] = normalized
+        return out
+
+    def decode(self, stored, out=None):
+        """Return stored values as out_dtype (or write them to out)
+
+        The decoding is vectorized: one multiplication and, for a non zero
+        offset, one addition in place.
+        """
+        if out is None:
+            out = np.empty(np.shape(stored), dtype=self.out_dtype)
+        np.multiply(stored, self.out_dtype.type(self.scale), out=out, casting="unsafe")
+        if self.offset:
+            out += self.out_dtype.type(self.offset)
+        return out
+
+    def measure_error(self, x, stored=None):
+        """Return the maximum absolute reconstruction error for x"""
+        if stored is None:
+            stored = self.encode(x)
+        return float(np.max(np.abs(self.decode(stored) - x), initial=0.0))
+
+    def to_dict(self):
+        """Return codec as dictionary (for JSON meta data)"""
+        return {"dtype": self.dtype.str,
+                "scale": self.scale,
+                "offset": self.offset,
+                "out_dtype": self.out_dtype.str}
+
+    @classmethod
+    def from_dict(cls, d):
+        """Create codec from a dictionary returned by to_dict"""
+        return cls(d["dtype"], d["scale"], d["offset"], d["out_dtype"])
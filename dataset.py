@@ -0,0 +1,349 @@
+"""Packed radar dataset
+
+The recorded dataset consists of class folders (e.g. new_new_data/Obuolys/)
+with one small .npy file of shape (num_rx, num_samples) per sample. Opening
+and loading thousands of these files costs several syscalls per sample.
+
+pack_dataset converts one or more of these class folder trees into a packed
+dataset directory:
+
+    samples.npy     all samples in one contiguous array (N, num_rx, num_samples)
+    labels.npy      class index per sample (N,)
+    ids.npy         file name (uuid) of every sample (N,)
+    sources.npy     index of the root folder every sample comes from (N,)
+    meta.json       class names, root folders, shape, dtype and codec
+
+BulkLoader reads class folder trees directly into one preallocated array
+with a thread pool, for data that is not packed.
+
+PackedDataset opens a packed dataset with np.memmap, so opening it is
+independent of the number of samples and slices are read without copying.
+
+With a codec (see codec.QuantizedCodec), samples.npy stores the quantized
+samples, e.g. the int16 ADC codes instead of float32, and PackedDataset
+decodes them when they are read.
+
+Example:
+    pack_dataset(["new_new_data"], "packed/new_new_data")
+    dataset = PackedDataset("packed/new_new_data")
+    X, y = dataset.load()
+
+Command line:
+    python dataset.py OUT_DIR ROOT [ROOT ...] [--codec adc|int16|float16]
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from codec import QuantizedCodec
+
+__all__ = ["PackedDataset", "BulkLoader", "pack_dataset", "list_class_folders", "read_npy_into",
+           "read_files_into"]
+
+_meta_name = "meta.json"
+_version = 1
+_chunk_size = 1024
+
+
+def list_class_folders(root):
+    """Return sorted lists of (class name, file paths) of a class folder tree
+
+    Parameters:
+        root    directory with one sub directory of .npy files per class
+    """
+    root = Path(root)
+    classes = []
+    for class_dir in sorted(p for p in root.iterdir() if p.is_dir()):
+        classes.append((class_dir.name, sorted(class_dir.glob("*.npy"))))
+    return classes
+
+
+def read_npy_into(path, out):
+    """Read the .npy file path directly into the array out
+
+    The header is parsed and the data is read into the memory of out without
+    an intermediate array. The shape and dtype of the file must match out.
+    """
+    with open(path, "rb") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        if shape != out.shape or dtype != out.dtype or fortran_order:
+            raise ValueError("{} has shape {} and dtype {}, expected {} and {}".format(
+                path, shape, dtype, out.shape, out.dtype))
+        if f.readinto(memoryview(out).cast("B")) != out.nbytes:
+            raise ValueError("{} is truncated".format(path))
+    return out
+
+
+def read_files_into(files, out, max_workers=8, chunk_size=64):
+    """Read the .npy files into the rows of out with a thread pool
+
+    The files are split into chunks of chunk_size files and at most
+    max_workers chunks are read concurrently. File reads release the GIL, so
+    the threads overlap the I/O latency of the files.
+
+    Parameters:
+        files           list of .npy file paths
+        out             array of shape (len(files),) + sample shape
+        max_workers     number of threads; 1 reads serially
+        chunk_size      number of files read by a thread at a time
+    """
+    def read_chunk(start):
+        for i in range(start, min(start + chunk_size, len(files))):
+            read_npy_into(files[i], out[i])
+
+    starts = range(0, len(files), chunk_size)
+    if max_workers <= 1:
+        for start in starts:
+            read_chunk(start)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # consume the results to raise errors of the workers
+            for _ in executor.map(read_chunk, starts):
+                pass
+    return out
+
+
+def _read_chunks(files, shape, dtype):
+    """Yield (start, chunk) with the samples of files read in chunks"""
+    buffer = np.empty((min(_chunk_size, len(files)),) + shape, dtype=dtype)
+    for start in range(0, len(files), _chunk_size):
+        chunk = buffer[:len(files[start:start + _chunk_size])]
+        for i, f in enumerate(files[start:start + _chunk_size]):
+            read_npy_into(f, chunk[i])
+        yield start, chunk
+
+
+def pack_dataset(roots, out_dir, codec=None):
+    """Pack class folder trees into a packed dataset directory
+
+    Classes with the same folder name in different roots are merged. The
+    sample shape is taken from the first file, all files must have the same
+    shape and dtype. Returns the opened PackedDataset.
+
+    Parameters:
+        roots       list of directories with class folders of .npy files
+        out_dir     directory the packed dataset is written to
+        codec       optional QuantizedCodec the samples are stored with; if
+                    it has no scale, it is fitted to the range of all samples.
+                    The measured maximum reconstruction error is stored in
+                    meta.json.
+    """
+    roots = [Path(root) for root in roots]
+    out_dir = Path(out_dir)
+
+    entries = []
+    for source, root in enumerate(roots):
+        for name, files in list_class_folders(root):
+            entries.extend((source, name, f) for f in files)
+    if not entries:
+        raise ValueError("No samples found in " + ", ".join(str(root) for root in roots))
+
+    first = np.load(entries[0][2], mmap_mode="r")
+    classes = sorted(set(name for _, name, _ in entries))
+    class_index = dict((name, i) for i, name in enumerate(classes))
+    files = [f for _, _, f in entries]
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # meta.json marks a complete dataset, remove it until everything is written
+    if (out_dir / _meta_name).exists():
+        (out_dir / _meta_name).unlink()
+
+    if codec is None:
+        samples = np.lib.format.open_memmap(out_dir / "samples.npy", mode="w+",
+                                            dtype=first.dtype, shape=(len(entries),) + first.shape)
+        read_files_into(files, samples)
+    else:
+        if codec.scale is None:
+            lo, hi = np.inf, -np.inf
+            for _, chunk in _read_chunks(files, first.shape, first.dtype):
+                lo, hi = min(lo, chunk.min()), max(hi, chunk.max())
+            codec = codec.fit(np.array([lo, hi]))
+        samples = np.lib.format.open_memmap(out_dir / "samples.npy", mode="w+",
+                                            dtype=codec.dtype, shape=(len(entries),) + first.shape)
+        max_error = 0.0
+        for start, chunk in _read_chunks(files, first.shape, first.dtype):
+            stored = codec.encode(chunk, out=samples[start:start + len(chunk)])
+            max_error = max(max_error, codec.measure_error(chunk, stored))
+    samples.flush()
+    del samples
+
+    np.save(out_dir / "labels.npy", np.array([class_index[name] for _, name, _ in entries], dtype=np.int16))
+    np.save(out_dir / "ids.npy", np.array([f.stem for f in files]))
+    np.save(out_dir / "sources.npy", np.array([source for source, _, _ in entries], dtype=np.int16))
+
+    meta = {"version": _version,
+            "classes": classes,
+            "sources": [str(root) for root in roots],
+            "shape": list(first.shape),
+            "dtype": first.dtype.str,
+            "count": len(entries)}
+    if codec is not None:
+        meta["codec"] = dict(codec.to_dict(), max_error=max_error)
+    with open(out_dir / _meta_name, "w") as f:
+        json.dump(meta, f, indent=1)
+
+    return PackedDataset(out_dir)
+
+
+class BulkLoader():
+    def __init__(self, roots, max_workers=8, chunk_size=64):
+        """Create loader for class folder trees
+
+        The class folders are listed once. Classes with the same folder name
+        in different roots are merged, labels are indices into the sorted
+        class names (as with pack_dataset).
+
+        Parameters:
+            roots           directory or list of directories with class
+                            folders of .npy files
+            max_workers     number of reading threads, see read_files_into
+            chunk_size      number of files read by a thread at a time
+        """
+        if isinstance(roots, (str, Path)):
+            roots = [roots]
+        self.roots = [Path(root) for root in roots]
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+
+        entries = []
+        for root in self.roots:
+            for name, files in list_class_folders(root):
+                entries.extend((name, f) for f in files)
+        if not entries:
+            raise ValueError("No samples found in " + ", ".join(str(root) for root in self.roots))
+        self.classes = sorted(set(name for name, _ in entries))
+        class_index = dict((name, i) for i, name in enumerate(self.classes))
+        self.files = [f for _, f in entries]
+        self.labels = np.array([class_index[name] for name, _ in entries], dtype=np.int16)
+
+        first = np.load(self.files[0], mmap_mode="r")
+        self.shape = (len(self.files),) + first.shape
+        self.dtype = first.dtype
+        self.stats = None
+
+    def __len__(self):
+        return len(self.files)
+
+    def load(self, out=None):
+        """Read all samples and return (X, y)
+
+        The throughput of the last call is stored in stats (files,
+        bytes, seconds, files_per_s, mb_per_s).
+
+        Parameters:
+            out     optional preallocated array of shape self.shape
+        """
+        if out is None:
+            out = np.empty(self.shape, dtype=self.dtype)
+        t_start = time.perf_counter()
+        read_files_into(self.files, out, self.max_workers, self.chunk_size)
+        seconds = time.perf_counter() - t_start
+        self.stats = {"files": len(self.files),
+                      "bytes": out.nbytes,
+                      "seconds": seconds,
+                      "files_per_s": len(self.files) / seconds,
+                      "mb_per_s": out.nbytes / 1e6 / seconds}
+        return out, self.labels.copy()
+
+
+class PackedDataset():
+    def __init__(self, path):
+        """Open a packed dataset written by pack_dataset
+
+        The arrays are memory mapped read-only. Indexing returns views and
+        the data is only read from disk when it is accessed. For a dataset
+        stored with a codec, samples holds the stored values and indexing
+        returns decoded arrays.
+
+        Parameters:
+            path    directory of the packed dataset
+        """
+        self.path = Path(path)
+        with open(self.path / _meta_name) as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != _version:
+            raise ValueError("Unsupported dataset version {}".format(self.meta["version"]))
+
+        self.classes = self.meta["classes"]
+        self.sources = self.meta["sources"]
+        self.shape = tuple(self.meta["shape"])
+        self.dtype = np.dtype(self.meta["dtype"])
+        self.codec = QuantizedCodec.from_dict(self.meta["codec"]) if "codec" in self.meta else None
+        self.samples = np.load(self.path / "samples.npy", mmap_mode="r")
+        self.labels = np.load(self.path / "labels.npy", mmap_mode="r")
+        self.ids = np.load(self.path / "ids.npy", mmap_mode="r")
+        self.source_index = np.load(self.path / "sources.npy", mmap_mode="r")
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, index):
+        """Return (samples, labels) for an index, slice or index array"""
+        return self.read(index), self.labels[index]
+
+    def read(self, index=slice(None), out=None):
+        """Return the (decoded) samples for an index, slice or index array
+
+        Parameters:
+            index   index, slice or index array
+            out     optional array the samples are written to
+        """
+        stored = self.samples[index]
+        if self.codec is not None:
+            return self.codec.decode(stored, out)
+        if out is None:
+            return stored
+        out[...] = stored
+        return out
+
+    def load(self, index=slice(None)):
+        """Return (X, y) for index (default: the whole dataset)
+
+        Without codec, X and y are memory mapped views for slices. Use
+        np.array(X) to load the data into memory.
+        """
+        return self.read(index), self.labels[index]
+
+    def label_names(self, labels=None):
+        """Return class names for the labels (default: of all samples)"""
+        labels = self.labels if labels is None else labels
+        return np.array(self.classes)[labels]
+
+    def item_path(self, index):
+        """Return the path of the original .npy file of a sample"""
+        return (Path(self.sources[self.source_index[index]])
+                / self.classes[self.labels[index]] / (str(self.ids[index]) + ".npy"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack class folder trees into a packed dataset")
+    parser.add_argument("out_dir")
+    parser.add_argument("roots", nargs="+")
+    parser.add_argument("--codec", choices=["adc", "int16", "float16"],
+                        help="store quantized samples (adc: int16 codes of the 12-bit ADC)")
+    args = parser.parse_args()
+
+    codec = None
+    if args.codec == "adc":
+        codec = QuantizedCodec.adc()
+    elif args.codec is not None:
+        codec = QuantizedCodec(args.codec)
+
+    dataset = pack_dataset(args.roots, args.out_dir, codec)
+    print("Packed {} samples of {} classes into {}".format(
+        len(dataset), len(dataset.classes), dataset.path))
+    if dataset.codec is not None:
+        print("Maximum reconstruction error: {:.3g}".format(dataset.meta["codec"]["max_error"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""Content-addressed on-disk cache of features
+
+Features are stored per transform (name and parameters, e.g. of a
+SpectrogramEngine) in a slab directory with memory mapped arrays:
+
+    meta.json       transform name, parameters, feature shape and dtype
+    features.npy    fixed number of feature rows (capacity, *shape)
+    keys.npy        content hash of the sample of every row ("" if free)
+    last_used.npy   time of the last access of every row, for LRU eviction
+
+The size of a slab is bounded by max_bytes; when it is full, the least
+recently used rows are reused. keys.npy is the index of a slab, so the cache
+survives restarts without a separate index file: a row is marked free while
+it is written and gets its key after its features, so a killed process never
+leaves a key pointing at wrong features. A cache directory must only be used
+by one process at a time.
+
+Example:
+    engine = SpectrogramEngine(n_fft=32, win_length=24, freq_crop=3, scale=5)
+    store = FeatureCache("cache").for_engine(engine, X.shape[1:])
+    features = store.transform(X, engine.transform)
+"""
+
+import hashlib
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+__all__ = ["FeatureCache", "FeatureStore", "sample_hash", "transform_key"]
+
+_version = 1
+_key_dtype = np.dtype("S32")
+
+
+def sample_hash(sample):
+    """Return the content hash (32 hex characters) of an array"""
+    sample = np.ascontiguousarray(sample)
+    h = hashlib.blake2b(digest_size=16)
+    h.update("{}{}".format(sample.dtype.str, sample.shape).encode("ascii"))
+    h.update(memoryview(sample).cast("B"))
+    return h.hexdigest()
+
+
+def transform_key(name, params):
+    """Return the slab name of a transform given by name and JSON serializable params"""
+    text = json.dumps([name, params], sort_keys=True)
+    return "{}-{}".format(name, hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest())
+
+
+class FeatureCache():
+    def __init__(self, directory, max_bytes=256 * 2 ** 20):
+        """Open or create a feature cache
+
+        Parameters:
+            directory   cache directory, created if missing
+            max_bytes   maximum size of the features of one transform
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._stores = {}
+
+    def store(self, name, params, shape, dtype):
+        """Return the FeatureStore of a transform
+
+        Parameters:
+            name        name of the transform
+            params      JSON serializable dictionary of the transform parameters
+            shape       shape of the features of one sample
+            dtype       dtype of the features
+        """
+        key = transform_key(name, params)
+        if key not in self._stores:
+            self._stores[key] = FeatureStore(self.directory / key, name, params,
+                                             shape, dtype, self.max_bytes)
+        return self._stores[key]
+
+    def for_engine(self, engine, sample_shape):
+        """Return the FeatureStore of a SpectrogramEngine for samples of sample_shape"""
+        return self.store(type(engine).__name__, engine.params,
+                          engine.output_shape(sample_shape), engine.dtype)
+
+    def clear(self):
+        """Remove all cached features"""
+        self._stores = {}
+        for path in self.directory.iterdir():
+            if path.is_dir():
+                shutil.rmtree(path)
+
+
+class FeatureStore():
+    def __init__(self, path, name, params, shape, dtype, max_bytes):
+        """Open or create the slab of one transform, see FeatureCache.store
+
+        An existing slab is reused if it was created with the same shape,
+        dtype and capacity, otherwise it is created anew.
+        """
+        self.path = Path(path)
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        row_bytes = max(1, int(np.prod(shape)) * dtype.itemsize)
+        self.capacity = max(1, max_bytes // row_bytes)
+        meta = {"version": _version,
+                "name": name,
+                "params": params,
+                "shape": list(shape),
+                "dtype": dtype.str,
+                "capacity": self.capacity}
+
+        existing = None
+        if (self.path / "meta.json").exists():
+            with open(self.path / "meta.json") as f:
+                existing = json.load(f)
+        if existing == meta:
+            mode = "r+"
+        else:
+            if self.path.exists():
+                shutil.rmtree(self.path)
+            self.path.mkdir(parents=True)
+            mode = "w+"
+
+        def open_array(file_name, dtype, shape):
+            if mode == "r+":
+                return np.load(self.path / file_name, mmap_mode="r+")
+            return np.lib.format.open_memmap(self.path / file_name, mode="w+", dtype=dtype, shape=shape)
+
+        self.features = open_array("features.npy", dtype, (self.capacity,) + shape)
+        self.keys = open_array("keys.npy", _key_dtype, (self.capacity,))
+        self.last_used = open_array("last_used.npy", np.uint64, (self.capacity,))
+        if mode == "w+":
+            # meta.json marks a complete slab
+            with open(self.path / "meta.json", "w") as f:
+                json.dump(meta, f, indent=1)
+
+        self.shape = shape
+        self.dtype = dtype
+        self._rows = dict((key, row) for row, key in enumerate(self.keys.tolist()) if key)
+        self._clock = int(self.last_used.max()) if self.capacity else 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return self._encode(key) in self._rows
+
+    @staticmethod
+    def _encode(key):
+        return key.encode("ascii") if isinstance(key, str) else key
+
+    def _touch(self, rows):
+        self._clock += 1
+        self.last_used[rows] = self._clock
+
+    def get(self, key):
+        """Return a read-only view of the features for key, or None
+
+        The view is a row of the slab: it is only valid until the next
+        insertion (put or transform), which may evict the row and overwrite
+        it with other features. Copy it to keep it longer.
+        """
+        row = self._rows.get(self._encode(key))
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touch(row)
+        view = self.features[row]
+        view.flags.writeable = False
+        return view
+
+    def _allocate(self, count):
+        """Return count rows to write, free rows first and then the least recently used"""
+        count = min(count, self.capacity)
+        if count == self.capacity:
+            rows = np.arange(self.capacity)
+        else:
+            rows = np.argpartition(self.last_used, count - 1)[:count]
+        for row in rows:
+            old = self.keys[row]
+            if old:
+                del self._rows[old]
+                self.evictions += 1
+        # mark the rows free until their features are written
+        self.keys[rows] = b""
+        return rows
+
+    def put(self, key, features):
+        """Store the features for key and return a read-only view of them
+
+        The view is only valid until the next insertion, see get.
+        """
+        key = self._encode(key)
+        row = self._rows.get(key)
+        if row is None:
+            row = int(self._allocate(1)[0])
+        self.features[row] = features
+        self.keys[row] = key
+        self._rows[key] = row
+        self._touch(row)
+        view = self.features[row]
+        view.flags.writeable = False
+        return view
+
+    def transform(self, X, compute, keys=None, out=None):
+        """Return the features of the samples X, computing only the missing ones
+
+        The features of all samples missing in the cache are computed with
+        one call compute(X[missing]) and stored. If there are more missing
+        samples than the capacity, only the features of the last samples
+        are stored; all features are returned.
+
+        Parameters:
+            X           array of samples (N, ...)
+            compute     function returning the features of a batch of samples
+            keys        content hashes of the samples (default: sample_hash
+                        of every sample); must equal sample_hash, e.g. the
+                        hashes of a Manifest to skip hashing
+            out         optional array (N, *shape) the features are written to
+        """
+        if keys is None:
+            keys = [sample_hash(x) for x in X]
+        keys = [self._encode(key) for key in keys]
+        if out is None:
+            out = np.empty((len(keys),) + self.shape, dtype=self.dtype)
+
+        rows = [self._rows.get(key) for key in keys]
+        hit = np.array([row is not None for row in rows], dtype=bool)
+        hit_rows = np.array([row for row in rows if row is not None], dtype=np.intp)
+        if len(hit_rows):
+            out[hit] = self.features[hit_rows]
+            self._touch(hit_rows)
+        self.hits += len(hit_rows)
+
+        missing = np.flatnonzero(~hit)
+        self.misses += len(missing)
+        if len(missing):
+            out[missing] = compute(X[missing])
+            # store each content once, hits of this call are most recently used;
+            # without room for all, the last samples are kept (most recent first)
+            unique = dict((keys[i], i) for i in missing[::-1])
+            new_rows = self._allocate(len(unique))
+            indices = np.array(list(unique.values())[:len(new_rows)], dtype=np.intp)
+            self.features[new_rows] = out[indices]
+            self.keys[new_rows] = [keys[i] for i in indices]
+            for row, i in zip(new_rows, indices):
+                self._rows[keys[i]] = int(row)
+            self._touch(new_rows)
+        return out
+
+    def stats(self):
+        """Return dictionary with size, capacity, hits, misses and evictions"""
+        return {"size": len(self._rows),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions}
+
+    def flush(self):
+        """Write the memory mapped arrays to disk"""
+        self.features.flush()
+        self.keys.flush()
+        self.last_used.flush()
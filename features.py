@@ -0,0 +1,296 @@
+"""Spectrogram features of radar samples
+
+The notebooks compute the features of every sample separately in get_x: a
+new torchaudio Spectrogram per file, the antennas stacked to a tensor, the
+spectrogram transposed to (time, frequency, antenna), scaled, cast to uint8
+and cropped to the lowest frequency bins. SpectrogramEngine computes the
+same features for a whole batch (N, num_rx, num_samples) with one transform
+call per chunk into a preallocated output array.
+
+The spectrogram is computed by torchaudio or, with backend="numpy", by
+NumpySpectrogram, a NumPy implementation of torchaudio.transforms.Spectrogram
+that does not import torch (e.g. for inference hosts).
+
+StreamingSTFT computes the spectrogram of a live stream incrementally: every
+pushed chunk of samples only adds its new columns to a ring buffered
+spectrogram image of a fixed number of columns.
+
+Example (features of xgb.ipynb):
+    engine = SpectrogramEngine(n_fft=32, win_length=24, freq_crop=3, scale=5)
+    features = engine.transform(X)      # (N, time, 3, num_rx) uint8
+"""
+
+import numpy as np
+
+__all__ = ["SpectrogramEngine", "NumpySpectrogram", "StreamingSTFT", "hann_window"]
+
+
+def hann_window(win_length, n_fft=None):
+    """Return the periodic Hann window (as torch.hann_window) centered in n_fft samples"""
+    n_fft = win_length if n_fft is None else n_fft
+    window = np.zeros(n_fft)
+    left = (n_fft - win_length) // 2
+    window[left:left + win_length] = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(win_length) / win_length)
+    return window
+
+
+class NumpySpectrogram():
+    def __init__(self, n_fft=400, win_length=None, hop_length=None, power=2.0, center=True):
+        """Power spectrogram computed like torchaudio.transforms.Spectrogram
+
+        Implements the defaults of torchaudio: the signal is padded by
+        n_fft // 2 samples at both ends by reflection (if center), a periodic
+        Hann window of win_length samples is zero padded to n_fft and the one
+        sided FFT of every frame is computed. All frames of all signals are
+        transformed with one batched rfft; the window is computed once.
+
+        Parameters:
+            n_fft       FFT size
+            win_length  window length (default: n_fft)
+            hop_length  hop length (default: win_length // 2)
+            power       exponent of the magnitude (2: power, 1: magnitude)
+            center      if True, the signal is padded so that frame t is
+                        centered at sample t * hop_length
+        """
+        self.n_fft = n_fft
+        self.win_length = win_length if win_length is not None else n_fft
+        self.hop_length = hop_length if hop_length is not None else self.win_length // 2
+        self.power = power
+        self.center = center
+        self.window = hann_window(self.win_length, n_fft)
+
+    def __call__(self, x):
+        """Return the spectrogram (..., n_fft // 2 + 1, frames) of x (..., time) as float32"""
+        x = np.asarray(x, dtype=np.float64)
+        if self.center:
+            pad = self.n_fft // 2
+            x = np.pad(x, [(0, 0)] * (x.ndim - 1) + [(pad, pad)], mode="reflect")
+        frames = np.lib.stride_tricks.sliding_window_view(x, self.n_fft, axis=-1)
+        frames = frames[..., ::self.hop_length, :]
+        spectrum = np.fft.rfft(frames * self.window, axis=-1)
+        if self.power == 2.0:
+            spec = spectrum.real ** 2 + spectrum.imag ** 2
+        else:
+            spec = np.abs(spectrum) ** self.power
+        return np.swapaxes(spec, -1, -2).astype(np.float32)
+
+
+class SpectrogramEngine():
+    def __init__(self, n_fft=64, win_length=None, hop_length=None, freq_crop=None,
+                 scale=None, dtype=np.uint8, batch_size=1024, backend="torch"):
+        """Create spectrogram engine
+
+        The transform (and its window) is created once. The features are
+
+            spectrogram / scale * 255      (if scale is given)
+
+        cast to dtype like np.ndarray.astype, i.e. values outside the range of
+        dtype are not clipped, as in the notebooks.
+
+        Parameters:
+            n_fft       FFT size, see torchaudio.transforms.Spectrogram
+            win_length  window length (default: n_fft)
+            hop_length  hop length (default: win_length // 2)
+            freq_crop   number of lowest frequency bins kept (e.g. 10 in
+                        train.ipynb, 3 in xgb.ipynb); None keeps all bins
+            scale       value mapped to 255; None uses the power as it is
+            dtype       dtype of the features
+            batch_size  number of samples transformed at a time, bounds the
+                        memory of the intermediate float spectrograms
+            backend     "torch" (torchaudio) or "numpy" (NumpySpectrogram,
+                        torch is not imported)
+        """
+        if backend not in ("torch", "numpy"):
+            raise ValueError("Unknown backend {}".format(backend))
+        self.backend = backend
+        self.n_fft = n_fft
+        self.win_length = win_length if win_length is not None else n_fft
+        self.hop_length = hop_length if hop_length is not None else self.win_length // 2
+        self.freq_crop = freq_crop
+        self.scale = scale
+        self.dtype = np.dtype(dtype)
+        self.batch_size = batch_size
+        if backend == "torch":
+            import torch
+            import torchaudio
+
+            self._torch = torch
+            self._transform = torchaudio.transforms.Spectrogram(
+                n_fft=n_fft, win_length=self.win_length, hop_length=self.hop_length)
+        else:
+            self._transform = NumpySpectrogram(n_fft, self.win_length, self.hop_length)
+
+    @property
+    def params(self):
+        """Dictionary of the parameters determining the features (e.g. as cache key)"""
+        return {"n_fft": self.n_fft,
+                "win_length": self.win_length,
+                "hop_length": self.hop_length,
+                "freq_crop": self.freq_crop,
+                "scale": self.scale,
+                "dtype": self.dtype.str,
+                "backend": self.backend}
+
+    def output_shape(self, shape):
+        """Return the feature shape for samples of shape (..., num_rx, num_samples)
+
+        The features have the shape (..., time, frequency, num_rx).
+        """
+        num_rx, num_samples = shape[-2:]
+        num_frames = num_samples // self.hop_length + 1
+        num_bins = self.n_fft // 2 + 1
+        if self.freq_crop is not None:
+            num_bins = min(num_bins, self.freq_crop)
+        return tuple(shape[:-2]) + (num_frames, num_bins, num_rx)
+
+    def spectrogram(self, chunk):
+        """Return the float spectrogram (N, rx, freq, time) of samples (N, rx, num_samples)
+
+        The spectrogram is not cropped, scaled or cast, see from_spectrogram.
+        """
+        chunk = np.asarray(chunk, dtype=np.float32)
+        if self.backend == "numpy":
+            return self._transform(chunk)
+        if not (chunk.flags.c_contiguous and chunk.flags.writeable):
+            # torch.from_numpy needs a writable array (not a read-only memory map)
+            chunk = np.array(chunk)
+        with self._torch.no_grad():
+            return self._transform(self._torch.from_numpy(chunk)).numpy()
+
+    def from_spectrogram(self, spec, out=None):
+        """Return the features of float spectrograms (N, rx, freq, time)
+
+        Applies the crop, scale and cast of the features, e.g. to
+        spectrograms shared by engines that only differ in freq_crop and
+        scale.
+        """
+        if self.freq_crop is not None:
+            spec = spec[:, :, :self.freq_crop]
+        if self.scale is not None:
+            spec = spec / self.scale * 255
+        # (N, rx, freq, time) -> (N, time, freq, rx)
+        spec = spec.transpose(0, 3, 2, 1)
+        if out is None:
+            out = np.empty(spec.shape, dtype=self.dtype)
+        np.copyto(out, spec, casting="unsafe")
+        return out
+
+    def transform(self, X, out=None):
+        """Return the features of the samples X
+
+        Parameters:
+            X       array of shape (N, num_rx, num_samples), or one sample of
+                    shape (num_rx, num_samples)
+            out     optional array of shape output_shape(X.shape) and dtype
+                    the features are written to
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if out is None:
+            out = np.empty(self.output_shape(X.shape), dtype=self.dtype)
+        single = X.ndim == 2
+        if single:
+            X = X[np.newaxis]
+        batch_out = out[np.newaxis] if single else out
+
+        for start in range(0, len(X), self.batch_size):
+            stop = min(start + self.batch_size, len(X))
+            self.from_spectrogram(self.spectrogram(X[start:stop]), batch_out[start:stop])
+        return out
+
+    __call__ = transform
+
+
+class StreamingSTFT():
+    def __init__(self, num_rx=3, n_fft=64, win_length=None, hop_length=None, context=64,
+                 freq_crop=None, scale=None, dtype=np.float32):
+        """Create incremental spectrogram of a live stream of samples
+
+        The stream is not padded (torchaudio center=False): column t covers
+        the samples t * hop_length to t * hop_length + n_fft. push() keeps the
+        samples not yet covered by a complete column and computes only the
+        new columns, so the cost of a chunk does not depend on context.
+
+        The columns are written twice into a ring of 2 * context columns, so
+        the last context columns are always one contiguous view (see
+        image()) without reordering. Crop, scale and cast of the columns are
+        the same as in SpectrogramEngine.
+
+        Parameters:
+            num_rx      number of antennas (rows of the pushed chunks)
+            n_fft       FFT size
+            win_length  window length (default: n_fft)
+            hop_length  hop length (default: win_length // 2)
+            context     number of columns of the spectrogram image
+            freq_crop   number of lowest frequency bins kept; None keeps all
+            scale       value mapped to 255; None uses the power as it is
+            dtype       dtype of the image (e.g. np.uint8 for the classifier
+                        features)
+        """
+        self.num_rx = num_rx
+        self.n_fft = n_fft
+        self.win_length = win_length if win_length is not None else n_fft
+        self.hop_length = hop_length if hop_length is not None else self.win_length // 2
+        self.context = context
+        self.scale = scale
+        self.dtype = np.dtype(dtype)
+        self.num_bins = n_fft // 2 + 1
+        if freq_crop is not None:
+            self.num_bins = min(self.num_bins, freq_crop)
+        self.window = hann_window(self.win_length, n_fft)
+        self._ring = np.zeros((2 * context, self.num_bins, num_rx), dtype=self.dtype)
+        self.reset()
+
+    def reset(self):
+        """Clear the image and the pending samples (e.g. after a gap in the stream)"""
+        self._ring[:] = 0
+        self._pending = np.empty((self.num_rx, 0))
+        self._head = 0
+        self.columns = 0
+
+    @property
+    def ready(self):
+        """True if the image consists of context computed columns"""
+        return self.columns >= self.context
+
+    def push(self, samples):
+        """Append samples (num_rx, n) to the stream and return the number of new columns"""
+        signal = np.concatenate([self._pending, np.asarray(samples, dtype=np.float64)], axis=1)
+        count = 0
+        if signal.shape[1] >= self.n_fft:
+            count = (signal.shape[1] - self.n_fft) // self.hop_length + 1
+        if count == 0:
+            self._pending = signal
+            return 0
+        # only the last context columns can be part of the image
+        skip = max(0, count - self.context)
+        start = skip * self.hop_length
+        frames = np.lib.stride_tricks.sliding_window_view(signal[:, start:], self.n_fft, axis=-1)
+        frames = frames[:, :(count - skip - 1) * self.hop_length + 1:self.hop_length]
+        spectrum = np.fft.rfft(frames * self.window, axis=-1)[..., :self.num_bins]
+        spec = (spectrum.real ** 2 + spectrum.imag ** 2).astype(np.float32)
+        if self.scale is not None:
+            spec = spec / self.scale * 255
+        # (rx, columns, freq) -> (columns, freq, rx)
+        columns = spec.transpose(1, 2, 0).astype(self.dtype)
+
+        rows = (self._head + skip + np.arange(count - skip)) % self.context
+        self._ring[rows] = columns
+        self._ring[rows + self.context] = columns
+        self._head = (self._head + count) % self.context
+        self._pending = signal[:, count * self.hop_length:]
+        self.columns += count
+        return count
+
+    def image(self, out=None):
+        """Return the last context columns (time, freq, num_rx), oldest first
+
+        Without out, a read-only view of the ring is returned, which changes
+        with the next push(). Columns not computed yet are zero.
+        """
+        view = self._ring[self._head:self._head + self.context]
+        if out is not None:
+            out[...] = view
+            return out
+        view = view.view()
+        view.flags.writeable = False
+        return view
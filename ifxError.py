@@ -37,8 +37,9 @@ ifx_error_app_base = 0x80000000
 
 def raise_exception_for_error_code(error_code,dll):
 
-    if error_code in error_mapping_exception:
-        raise eval(error_mapping_exception[error_code])(dll)
+    exception_class = _exception_classes.get(error_code)
+    if exception_class is not None:
+        raise exception_class(dll)
     else:
         raise GeneralError(error_code,dll)  
 
@@ -338,3 +339,11 @@ class ErrorApp(ErrorAppBase):
     ''' A generic error occurred on Application side '''
     def __init__(self,dll):
         super().__init__(ifx_error_app_base             ,dll)
+
+# error code to exception class, resolved once at import instead of on every raise
+_exception_classes = dict((code, globals()[name]) for code, name in error_mapping_exception.items())
+_error_codes = dict((exception_class, code) for code, exception_class in _exception_classes.items())
+
+def error_code_for_exception(exception_class):
+    """Return the error code that is raised as exception_class"""
+    return _error_codes[exception_class]
@@ -45,7 +45,8 @@ if _cur_dir not in sys.path:
     sys.path.append(_cur_dir)
 
 from ctypes import *
-import platform, os, sys
+import platform, os, sys, threading, time, contextlib
+from collections import Counter
 import numpy as np
 from ifxError import *
 
@@ -53,8 +54,9 @@ from ifxError import *
 #   from ifxRadarSDK import *
 # would import all objects, including the ones from ctypes. To avoid name space
 # pollution, we list what symbols should be exported.
-__all__ = ["Frame", "Device", "GeneralError",
-           "get_version", "get_version_full", "ShieldType"]
+__all__ = ["Frame", "FramePool", "Device", "GeneralError",
+           "get_version", "get_version_full", "ShieldType",
+           "set_backend", "get_backend"]
 
 def find_library():
     """Find path to dll/shared object"""
@@ -295,13 +297,56 @@ def initialize_module():
     dll.ifx_list_get.restype = c_void_p
     dll.ifx_list_get.argtypes = [c_void_p, c_size_t]
 
-    # export the error class
-    for actual_error_class in error_class_list:
-        __all__.append(actual_error_class)
+    return dll
 
+class _LazyLibrary():
+    """Load the radar SDK library on first use
+
+    Loading the library and setting up the function prototypes is deferred
+    until the first function of the library is used. This keeps importing
+    the module fast and allows importing it on machines without the library
+    (e.g. to select another backend with set_backend). If the library cannot
+    be loaded, every call into the library raises the error.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.library = None
+
+    def __getattr__(self, name):
+        global dll
+        with self.lock:
+            if self.library is None:
+                self.library = initialize_module()
+            if dll is self:
+                dll = self.library
+        return getattr(self.library, name)
+
+def set_backend(backend):
+    """Select the backend used for all calls into the radar SDK
+
+    The backend must provide the functions of the radar SDK library that are
+    set up in initialize_module, for example simulator.ReplayBackend which
+    replays recorded frames without a radar device attached. If backend is
+    None, the radar SDK library is used again (loaded on first use).
+
+    Devices and frames created before keep using the backend that created
+    them, including when they are destroyed.
+
+    Parameters:
+        backend     object implementing the radar SDK functions or None
+    """
+    global dll
+    dll = _LazyLibrary() if backend is None else backend
+
+def get_backend():
+    """Return the backend used for all calls into the radar SDK"""
     return dll
 
-dll = initialize_module()
+# export the error class
+for actual_error_class in error_class_list:
+    __all__.append(actual_error_class)
+
+dll = _LazyLibrary()
 
 def get_version():
     """Return SDK version string (excluding git tag from which it was build)"""
@@ -311,13 +356,19 @@ def get_version_full():
     """Return full SDK version string including git tag from which it was build"""
     return dll.ifx_sdk_get_version_string_full().decode("ascii")
 
-def check_rc(error_code=None):
-    """Raise an exception if error_code is not IFX_OK (0)"""
-    if error_code == None:
-        error_code = dll.ifx_error_get_and_clear()
+def check_rc(error_code=None, library=None):
+    """Raise an exception if error_code is not IFX_OK (0)
+
+    If error_code is None, the error is taken from library (default: the
+    current backend).
+    """
+    if library is None:
+        library = dll
+    if error_code is None:
+        error_code = library.ifx_error_get_and_clear()
 
     if error_code:
-        raise_exception_for_error_code(error_code, dll)
+        raise_exception_for_error_code(error_code, library)
 
 class Frame():
     def __init__(self, num_antennas, num_chirps_per_frame, num_samples_per_chirp):
@@ -335,20 +386,26 @@ class Frame():
             num_chirps_per_frame    Number of chirps configured in a frame
             num_samples_per_chirp   Number of chirps configured in a frame
         """
-        self.handle = dll.ifx_frame_create_r(num_antennas, num_chirps_per_frame, num_samples_per_chirp)
-        check_rc()
+        self._dll = dll
+        self.handle = self._dll.ifx_frame_create_r(num_antennas, num_chirps_per_frame, num_samples_per_chirp)
+        check_rc(library=self._dll)
 
     @classmethod
-    def create_from_pointer(cls, framepointer):
-        """Create Frame from FramePointer"""
+    def create_from_pointer(cls, framepointer, library=None):
+        """Create Frame from FramePointer
+
+        The frame is destroyed with library (default: the current backend),
+        which must be the backend that created the frame.
+        """
         self = cls.__new__(cls)
+        self._dll = dll if library is None else library
         self.handle = framepointer
         return self
 
     def __del__(self):
         """Destroy frame handle"""
         if hasattr(self, "handle"):
-            dll.ifx_frame_destroy_r(self.handle)
+            self._dll.ifx_frame_destroy_r(self.handle)
 
     def get_num_rx(self):
         """Return the number of virtual active Rx antennas in the radar device"""
@@ -368,13 +425,172 @@ class Frame():
         # we don't have to free mat because the matrix is saved in the frame
         # handle.
         # matrices are in C order (row major order)
-        mat = dll.ifx_frame_get_mat_from_antenna_r(self.handle, antenna)
+        mat = self._dll.ifx_frame_get_mat_from_antenna_r(self.handle, antenna)
         d = mat.contents.d
         shape = (mat.contents.rows, mat.contents.cols)
         return np.array(np.ctypeslib.as_array(d, shape), order="C", copy=copy)
 
+    def _antenna_views(self):
+        """Return list of ndarray views, one per antenna, respecting lda"""
+        frame = self.handle.contents
+        views = []
+        for antenna in range(frame.num_rx):
+            mat = frame.rx_data[antenna].contents
+            lda = mat.lda or mat.cols
+            rows_p = cast(mat.d, POINTER(c_float * (lda * mat.rows)))
+            view = np.frombuffer(rows_p.contents, dtype=np.float32)
+            views.append(view.reshape(mat.rows, lda)[:, :mat.cols])
+        return views
+
+    def _frame_view(self):
+        """Return a single (num_rx, rows, cols) view or None
+
+        A single view over all antennas is only possible if all antenna
+        matrices have the same dimensions and are placed equidistantly in
+        memory. The result is cached as the matrices of a frame never move.
+        """
+        if hasattr(self, "_view"):
+            return self._view
+
+        frame = self.handle.contents
+        mats = [frame.rx_data[antenna].contents for antenna in range(frame.num_rx)]
+        self._view = None
+        if not mats:
+            return None
+
+        rows, cols, lda = mats[0].rows, mats[0].cols, mats[0].lda or mats[0].cols
+        addresses = [cast(mat.d, c_void_p).value for mat in mats]
+        itemsize = sizeof(c_float)
+        step = addresses[1] - addresses[0] if len(mats) > 1 else rows * lda * itemsize
+        for i, mat in enumerate(mats):
+            if (mat.rows, mat.cols, mat.lda or mat.cols) != (rows, cols, lda):
+                return None
+            if addresses[i] != addresses[0] + i * step:
+                return None
+        if step <= 0 or step % itemsize:
+            return None
+
+        size = (len(mats) - 1) * (step // itemsize) + rows * lda
+        buf = np.frombuffer((c_float * size).from_address(addresses[0]), dtype=np.float32)
+        self._view = np.lib.stride_tricks.as_strided(
+            buf, shape=(len(mats), rows, cols), strides=(step, lda * itemsize, itemsize))
+        return self._view
+
+    def as_array(self, copy=False, out=None):
+        """Get the data of all antennas as one ndarray
+
+        The returned array has the shape (num_rx, num_chirps_per_frame,
+        num_samples_per_chirp) and dtype float32.
+
+        If copy is False and the antenna matrices can be described by a single
+        strided array, a view on the memory of the frame is returned. The view
+        is refilled by every Device.get_next_frame and must *not* be used after
+        the frame object has been destroyed. Otherwise a new array is returned.
+
+        If out is given, the data is copied into the caller-owned array out
+        (of matching shape) and out is returned. This avoids any allocation
+        in acquisition loops.
+
+        Parameters:
+            copy        if True a copy of the data will be returned
+            out         optional array the data is copied to
+        """
+        view = self._frame_view()
+        if out is not None:
+            if view is not None:
+                np.copyto(out, view)
+            else:
+                for antenna, mat in enumerate(self._antenna_views()):
+                    np.copyto(out[antenna], mat)
+            return out
+
+        if view is not None:
+            return view.copy() if copy else view
+        return np.array(self._antenna_views(), dtype=np.float32)
+
+
+class FramePool():
+    def __init__(self, device, size=2):
+        """Create pool of frames for the current configuration of device
+
+        All frames are allocated when the pool is created, so no native
+        memory is allocated or freed while frames are acquired. Frames are
+        taken from the pool with acquire() and must be given back with
+        release() (or by using the context manager frame()). A pool of size 2
+        or 3 allows double or triple buffering: one frame is filled by the
+        device while the previous ones are processed.
+
+        The pool is tied to the device configuration it was created with. If
+        the device is reconfigured, a new pool must be created.
+
+        Examples:
+            pool = FramePool(device, 2)
+            for frame in device.stream(pool=pool):
+                process(frame)
+                pool.release(frame)
+
+        Parameters:
+            device      configured Device
+            size        number of frames in the pool
+        """
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.config = device.get_config()
+        self._frames = [device.create_frame_from_device_handle() for _ in range(size)]
+        self._free = list(self._frames)
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._frames)
+
+    @property
+    def num_free(self):
+        """Number of frames that can be acquired without waiting"""
+        return len(self._free)
+
+    def check(self, device):
+        """Raise ValueError if device is configured differently than the pool"""
+        if device.get_config() != self.config:
+            raise ValueError("Frame pool does not match the device configuration")
+
+    def acquire(self, timeout=None):
+        """Take a frame from the pool
+
+        Waits until a frame is released if all frames are in use. Raises
+        TimeoutError if no frame gets free within timeout seconds.
+
+        Parameters:
+            timeout     timeout in seconds; if None, wait forever
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._free, timeout):
+                raise TimeoutError("No free frame within {} s".format(timeout))
+            return self._free.pop()
+
+    def release(self, frame):
+        """Give a frame taken with acquire back to the pool"""
+        with self._cond:
+            if not any(frame is f for f in self._frames):
+                raise ValueError("Frame does not belong to this pool")
+            if any(frame is f for f in self._free):
+                raise ValueError("Frame was already released")
+            self._free.append(frame)
+            self._cond.notify()
+
+    @contextlib.contextmanager
+    def frame(self, timeout=None):
+        """Context manager acquiring a frame and releasing it afterwards"""
+        frame = self.acquire(timeout)
+        try:
+            yield frame
+        finally:
+            self.release(frame)
+
 
 class Device():
+    # errors try_get_next_frame counts and returns instead of raising
+    recoverable_errors = frozenset(error_code_for_exception(e) for e in (ErrorTimeout, ErrorFifoOverflow))
+
     @staticmethod
     def get_list(shield_type=ShieldType.Any):
         """Return a list of com ports
@@ -440,18 +656,25 @@ class Device():
                             0123456789abcdef0123456789abcdef
                             01234567-89ab-cdef-0123-456789abcdef
         """
+        # all calls for this handle go to the backend that created it, also
+        # after set_backend
+        self._dll = dll
         h = None
         if uuid:
-            h = dll.ifx_device_create_by_uuid(uuid.encode("ascii"))
+            h = self._dll.ifx_device_create_by_uuid(uuid.encode("ascii"))
         elif port:
-            h = dll.ifx_device_create_by_port(port.encode("ascii"))
+            h = self._dll.ifx_device_create_by_port(port.encode("ascii"))
         else:
-            h = dll.ifx_device_create()
+            h = self._dll.ifx_device_create()
         
         self.handle = c_void_p(h) # Reason of that cast HMI-2896
 
+        # number of recoverable errors per error name, see try_get_next_frame
+        self.error_counts = Counter()
+        self.telemetry = None
+
         # check return code
-        check_rc()
+        check_rc(library=self._dll)
         
     def _mimo_c_val_2_str(mimo_int):
          if(mimo_int == 0):
@@ -562,7 +785,7 @@ class Device():
         
         config = DeviceConfigStruct()
 
-        dll.ifx_device_translate_metrics_to_config(self.handle, byref(m), byref(config))
+        self._dll.ifx_device_translate_metrics_to_config(self.handle, byref(m), byref(config))
         c_dict = dict()
         for field in config._fields_:
             name = field[0]
@@ -660,30 +883,30 @@ class Device():
                                     chirp_repetition_time_s,
                                     frame_repetition_time_s,
                                     mimo_mode)
-        dll.ifx_device_set_config(self.handle, byref(config))
-        check_rc()
+        self._dll.ifx_device_set_config(self.handle, byref(config))
+        check_rc(library=self._dll)
 
     def get_config(self):
         """Get the configuration from the device"""
         config = DeviceConfigStruct()
-        dll.ifx_device_get_config(self.handle, byref(config))
-        check_rc()
+        self._dll.ifx_device_get_config(self.handle, byref(config))
+        check_rc(library=self._dll)
         # return struct as dictionary
         return dict((field, getattr(config, field)) for field, _ in config._fields_)
 
     def get_config_defaults(self):
         """Get the default configuration from the device"""
         config = DeviceConfigStruct()
-        dll.ifx_device_get_config_defaults(self.handle, byref(config))
-        check_rc()
+        self._dll.ifx_device_get_config_defaults(self.handle, byref(config))
+        check_rc(library=self._dll)
         # return struct as dictionary
         return dict((field, getattr(config, field)) for field, _ in config._fields_)
 
     def get_metrics_defaults(self):
         """Get the default metrics from the device"""
         metrics = DeviceMetricsStruct()
-        dll.ifx_device_get_metrics_defaults(self.handle, byref(metrics))
-        check_rc()
+        self._dll.ifx_device_get_metrics_defaults(self.handle, byref(metrics))
+        check_rc(library=self._dll)
         # return struct as dictionary
         return dict((field, getattr(metrics, field)) for field, _ in metrics._fields_)    
 
@@ -693,8 +916,8 @@ class Device():
         Starts the acquisition of time domain data from the connected device.
         If the data acquisition is already running the function has no effect.
         """
-        ret = dll.ifx_device_start_acquisition(self.handle)
-        check_rc()
+        ret = self._dll.ifx_device_start_acquisition(self.handle)
+        check_rc(library=self._dll)
         return ret
 
     def stop_acquisition(self):
@@ -703,8 +926,10 @@ class Device():
         Stops the acquisition of time domain data from the connected device.
         If the data acquisition is already stopped the function has no effect.
         """
-        ret = dll.ifx_device_stop_acquisition(self.handle)
-        check_rc()
+        ret = self._dll.ifx_device_stop_acquisition(self.handle)
+        check_rc(library=self._dll)
+        if self.telemetry is not None:
+            self.telemetry.restart()
         return ret
 
     def get_next_frame(self, frame, timeout_ms=None):
@@ -717,11 +942,160 @@ class Device():
         If timeout_ms is given, an IFX_ERROR_TIMEOUT exception is thrown if a
         complete frame is not given within timeout_ms miliseconds.
         """
+        telemetry = self.telemetry
+        if telemetry is not None:
+            t_start = time.monotonic()
         if timeout_ms:
-            ret = dll.ifx_device_get_next_frame_timeout(self.handle, frame.handle, timeout_ms)
+            ret = self._dll.ifx_device_get_next_frame_timeout(self.handle, frame.handle, timeout_ms)
         else:
-            ret = dll.ifx_device_get_next_frame(self.handle, frame.handle)
-        check_rc(ret)
+            ret = self._dll.ifx_device_get_next_frame(self.handle, frame.handle)
+        if telemetry is not None:
+            self._record(telemetry, t_start, ret)
+        if ret:
+            # the SDK also keeps the error, clear it so it is not reported twice
+            self._dll.ifx_error_get_and_clear()
+            raise_exception_for_error_code(ret, self._dll)
+
+    def try_get_next_frame(self, frame, timeout_ms=None):
+        """Retrieve next frame of time domain data without raising recoverable errors
+
+        Fast path of get_next_frame for acquisition loops: the return code of
+        the SDK is used directly and the error state of the SDK is only
+        cleared if the call failed. Errors in recoverable_errors (timeouts and
+        FIFO overflows by default) are counted in error_counts and their error
+        code is returned instead of raising an exception. All other errors
+        raise an exception as in get_next_frame.
+
+        Returns 0 if a frame was retrieved, otherwise the error code.
+        """
+        telemetry = self.telemetry
+        if telemetry is not None:
+            t_start = time.monotonic()
+        if timeout_ms:
+            ret = self._dll.ifx_device_get_next_frame_timeout(self.handle, frame.handle, timeout_ms)
+        else:
+            ret = self._dll.ifx_device_get_next_frame(self.handle, frame.handle)
+        if telemetry is not None:
+            self._record(telemetry, t_start, ret)
+        if not ret:
+            return 0
+
+        self._dll.ifx_error_get_and_clear()
+        if ret not in self.recoverable_errors:
+            raise_exception_for_error_code(ret, self._dll)
+        self.error_counts[error_mapping_exception[ret]] += 1
+        return ret
+
+    def set_telemetry(self, telemetry):
+        """Attach telemetry to the device
+
+        Every call of get_next_frame and try_get_next_frame is then recorded
+        in telemetry (see telemetry.AcquisitionTelemetry) and the temperature
+        is read in the interval requested by telemetry. If the frame period
+        of telemetry is not set, it is taken from the current configuration
+        of the device. Pass None to detach the telemetry.
+
+        Parameters:
+            telemetry   telemetry.AcquisitionTelemetry or None
+        """
+        if telemetry is not None and telemetry.frame_period_s is None:
+            telemetry.frame_period_s = self.get_config()["frame_repetition_time_s"]
+        self.telemetry = telemetry
+
+    def _record(self, telemetry, t_start, ret):
+        """Record a frame read in telemetry"""
+        t_end = time.monotonic()
+        if ret:
+            telemetry.record_error(error_mapping_exception.get(ret, str(ret)))
+        else:
+            telemetry.record_frame(t_start, t_end)
+
+        if telemetry.temperature_due(t_end):
+            try:
+                telemetry.record_temperature(self.get_temperature(), t_end)
+            except GeneralError:
+                # reading the temperature is not supported by all devices
+                telemetry.temperature_interval_s = None
+
+    def stream(self, n_frames=None, timeout_ms=None, frame=None, pool=None):
+        """Yield consecutive frames of time domain data from device
+
+        The acquisition is started once and a single frame is allocated
+        according to the current configuration of the device (unless a frame
+        is given). This frame is refilled and yielded for every acquired
+        frame, so the data of a yielded frame is only valid until the next
+        iteration. Use Frame.get_mat_from_antenna (with copy=True) to keep the
+        data.
+
+        If pool is given, every frame is taken from the FramePool pool
+        instead. The caller owns a yielded frame until it is given back with
+        pool.release(frame), so frames can be processed while the next ones
+        are acquired (double or triple buffering with a pool of size 2 or 3).
+
+        The acquisition is stopped when n_frames frames have been yielded or
+        when the generator is closed (e.g. by leaving a for loop with break).
+
+        Examples:
+          - Read 100 frames:
+            for frame in device.stream(100):
+                mat = frame.get_mat_from_antenna(0)
+          - Read frames until stopped by the caller:
+            for frame in device.stream(timeout_ms=1000):
+                ...
+
+        Parameters:
+            n_frames    number of frames to acquire; if None, frames are
+                        acquired until the generator is closed
+            timeout_ms  timeout for each frame, see get_next_frame
+            frame       optional frame to use instead of allocating one
+            pool        optional FramePool the frames are taken from
+        """
+        if pool is not None:
+            pool.check(self)
+        elif frame is None:
+            frame = self.create_frame_from_device_handle()
+        self.start_acquisition()
+        try:
+            frame_number = 0
+            while n_frames is None or frame_number < n_frames:
+                if pool is not None:
+                    frame = pool.acquire()
+                try:
+                    self.get_next_frame(frame, timeout_ms)
+                except BaseException:
+                    # also on GeneratorExit/KeyboardInterrupt: the caller never got the frame
+                    if pool is not None:
+                        pool.release(frame)
+                    raise
+                yield frame
+                frame_number += 1
+        finally:
+            # the device might have been closed while the generator was alive
+            if self.handle:
+                self.stop_acquisition()
+
+    def get_frames(self, n_frames, timeout_ms=None, out=None, frame=None):
+        """Acquire n_frames consecutive frames into one array
+
+        All frames are acquired within a single acquisition run and copied
+        into an array of shape (n_frames, num_rx, num_chirps_per_frame,
+        num_samples_per_chirp). If out is given, the frames are copied into
+        out and out is returned, otherwise a new array is allocated.
+
+        Parameters:
+            n_frames    number of frames to acquire
+            timeout_ms  timeout for each frame, see get_next_frame
+            out         optional array the frames are copied to
+            frame       optional frame to use instead of allocating one
+        """
+        if frame is None:
+            frame = self.create_frame_from_device_handle()
+        if out is None:
+            out = np.empty((n_frames,) + frame.as_array().shape, dtype=np.float32)
+
+        for frame_number, frame in enumerate(self.stream(n_frames, timeout_ms, frame)):
+            frame.as_array(out=out[frame_number])
+        return out
 
     def create_frame_from_device_handle(self):
         """Create frame for time domain data acquisition
@@ -730,14 +1104,14 @@ class Device():
         device and initializes a data structure that can hold a time domain
         data frame according acquired through that device.
         """
-        frame_p = dll.ifx_device_create_frame_from_device_handle(self.handle)
-        check_rc()
-        return Frame.create_from_pointer(frame_p)
+        frame_p = self._dll.ifx_device_create_frame_from_device_handle(self.handle)
+        check_rc(library=self._dll)
+        return Frame.create_from_pointer(frame_p, self._dll)
 
     def get_shield_uuid(self):
         """Get the unique id for the radar shield"""
-        c_uuid = dll.ifx_device_get_shield_uuid(self.handle)
-        check_rc()
+        c_uuid = self._dll.ifx_device_get_shield_uuid(self.handle)
+        check_rc(library=self._dll)
         return c_uuid.decode("utf-8")
 
     def get_temperature(self):
@@ -747,29 +1121,29 @@ class Device():
         exception will be raised in this case.
         """
         temperature = c_float(0)
-        dll.ifx_device_get_temperature(self.handle, pointer(temperature))
-        check_rc()
+        self._dll.ifx_device_get_temperature(self.handle, pointer(temperature))
+        check_rc(library=self._dll)
         return float(temperature.value)
 
     def get_firmware_information(self):
-        info_p = dll.ifx_device_get_firmware_information(self.handle)
-        check_rc()
+        info_p = self._dll.ifx_device_get_firmware_information(self.handle)
+        check_rc(library=self._dll)
         return dict((field, getattr(info_p.contents, field)) for field, _ in info_p.contents._fields_)
 
     def get_device_information(self):
-        info_p = dll.ifx_device_get_device_information(self.handle)
-        check_rc()
+        info_p = self._dll.ifx_device_get_device_information(self.handle)
+        check_rc(library=self._dll)
         d = dict((field, getattr(info_p.contents, field)) for field, _ in info_p.contents._fields_)
         d["shield_type"] = ShieldType(d["shield_type"])
         return d
 
     def get_register_list_string(self,trigger):
         """Get the exported register list as a hexadecimal string"""
-        ptr = dll.ifx_device_register_list_string(self.handle,trigger)
-        check_rc()
+        ptr = self._dll.ifx_device_register_list_string(self.handle,trigger)
+        check_rc(library=self._dll)
         reg_list_string = cast(ptr, c_char_p).value
         reg_list_string_py = reg_list_string.decode('ascii')
-        dll.ifx_mem_free(ptr)
+        self._dll.ifx_mem_free(ptr)
         return reg_list_string_py
 
     def __enter__(self):
@@ -781,5 +1155,5 @@ class Device():
     def __del__(self):
         """Destroy device handle"""
         if hasattr(self, "handle") and self.handle:
-            dll.ifx_device_destroy(self.handle)
+            self._dll.ifx_device_destroy(self.handle)
             self.handle = None
@@ -0,0 +1,182 @@
+"""Dataset manifest with content hashes
+
+A manifest records path, size, modification time, content hash, label,
+shape and dtype of every sample of a class folder tree (see
+dataset.list_class_folders). Building a manifest with the previous manifest
+only hashes files whose size or modification time changed, and the diff of
+two manifests lists the added, changed and removed samples, so later stages
+only need to process these.
+
+The content hash of a sample is feature_cache.sample_hash of its array, so
+the hashes can be used as keys of a FeatureStore.
+
+Example:
+    previous = Manifest.load("new_new_data/manifest.json")
+    manifest = Manifest.build("new_new_data", previous)
+    diff = manifest.diff(previous)
+    for path in diff["added"] + diff["changed"]:
+        ...
+    manifest.save("new_new_data/manifest.json")
+
+Command line:
+    python manifest.py ROOT [--manifest PATH]
+"""
+
+import argparse
+import io
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from dataset import list_class_folders
+from feature_cache import sample_hash
+
+__all__ = ["Manifest", "hash_file"]
+
+_version = 2
+_manifest_name = "manifest.json"
+
+
+def hash_file(path):
+    """Return (content hash, shape, dtype) of the .npy file path
+
+    The file is read once; shape and dtype are parsed from its header. The
+    hash is sample_hash of the array, i.e. it does not depend on the header
+    layout.
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+    header = io.BytesIO(content)
+    version = np.lib.format.read_magic(header)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(header)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(header)
+    array = np.frombuffer(content, dtype=dtype, count=int(np.prod(shape)), offset=header.tell())
+    array = array.reshape(shape, order="F" if fortran_order else "C")
+    return sample_hash(array), shape, dtype
+
+
+class Manifest():
+    def __init__(self, root, entries=None):
+        """Create manifest of the class folder tree root
+
+        Use Manifest.build to scan a directory and Manifest.load to read a
+        saved manifest.
+
+        Parameters:
+            root        directory with one sub directory of .npy files per class
+            entries     dictionary of path relative to root (with "/" as
+                        separator) to entry dictionary with the keys size,
+                        mtime_ns, hash, label, shape and dtype
+        """
+        self.root = Path(root)
+        self.entries = dict(entries or {})
+        self.hashed = 0
+
+    @classmethod
+    def build(cls, root, previous=None):
+        """Scan root and return its manifest
+
+        Files with the same size and modification time as in previous keep
+        their hash and are not read.
+
+        Parameters:
+            root        directory with one sub directory of .npy files per class
+            previous    optional previous Manifest of root
+        """
+        manifest = cls(root)
+        old_entries = previous.entries if previous is not None else {}
+        for label, files in list_class_folders(root):
+            for path in files:
+                key = path.relative_to(manifest.root).as_posix()
+                stat = path.stat()
+                old = old_entries.get(key)
+                if (old is not None and old["size"] == stat.st_size
+                        and old["mtime_ns"] == stat.st_mtime_ns and old["label"] == label):
+                    manifest.entries[key] = old
+                    continue
+                digest, shape, dtype = hash_file(path)
+                manifest.hashed += 1
+                manifest.entries[key] = {"size": stat.st_size,
+                                         "mtime_ns": stat.st_mtime_ns,
+                                         "hash": digest,
+                                         "label": label,
+                                         "shape": list(shape),
+                                         "dtype": dtype.str}
+        return manifest
+
+    def diff(self, previous):
+        """Return dictionary with sorted lists of added, changed and removed paths
+
+        A sample is changed if its content hash or label differs. Paths are
+        relative to root. previous may be None (everything is added).
+        """
+        old_entries = previous.entries if previous is not None else {}
+        added, changed = [], []
+        for key, entry in self.entries.items():
+            old = old_entries.get(key)
+            if old is None:
+                added.append(key)
+            elif old["hash"] != entry["hash"] or old["label"] != entry["label"]:
+                changed.append(key)
+        removed = [key for key in old_entries if key not in self.entries]
+        return {"added": sorted(added), "changed": sorted(changed), "removed": sorted(removed)}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def paths(self, keys=None):
+        """Return absolute paths for keys (default: all samples)"""
+        keys = sorted(self.entries) if keys is None else keys
+        return [self.root / key for key in keys]
+
+    def labels(self, keys=None):
+        """Return labels for keys (default: all samples in sorted order)"""
+        keys = sorted(self.entries) if keys is None else keys
+        return [self.entries[key]["label"] for key in keys]
+
+    def save(self, path=None):
+        """Write manifest as JSON (default: manifest.json in root)
+
+        The file is replaced atomically.
+        """
+        path = Path(path) if path is not None else self.root / _manifest_name
+        tmp_path = str(path) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": _version, "root": str(self.root), "entries": self.entries},
+                      f, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read manifest written by save; returns None if path does not exist"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        with open(path) as f:
+            data = json.load(f)
+        if data["version"] != _version:
+            raise ValueError("Unsupported manifest version {}".format(data["version"]))
+        return cls(data["root"], data["entries"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the manifest of a class folder tree")
+    parser.add_argument("root")
+    parser.add_argument("--manifest", help="manifest file (default: ROOT/manifest.json)")
+    args = parser.parse_args()
+
+    path = args.manifest or os.path.join(args.root, _manifest_name)
+    previous = Manifest.load(path)
+    manifest = Manifest.build(args.root, previous)
+    diff = manifest.diff(previous)
+    manifest.save(path)
+    print("{} samples, {} hashed: {} added, {} changed, {} removed".format(
+        len(manifest), manifest.hashed, len(diff["added"]), len(diff["changed"]), len(diff["removed"])))
+
+
+if __name__ == "__main__":
+    main()
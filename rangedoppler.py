@@ -0,0 +1,132 @@
+"""Range and range-Doppler processing of radar frames
+
+A frame (see Frame.as_array) holds num_samples_per_chirp ADC samples of
+num_chirps_per_frame chirps for every RX antenna. RangeDopplerProcessor
+turns frames into range profiles (FFT over the samples of every chirp) and
+range-Doppler maps (FFT over the chirps of every range bin) for all antennas
+and any number of frames with one vectorized call per step.
+
+The windows and the physical axes are computed once from the device
+configuration (the dictionary of Device.translate_metrics_to_config or
+Device.get_config). NumPy caches the FFT plans for the FFT sizes.
+
+Example:
+    processor = RangeDopplerProcessor(device.get_config())
+    for frame in device.stream():
+        rd_map = processor.range_doppler(frame.as_array())   # (rx, doppler, range)
+"""
+
+import numpy as np
+
+__all__ = ["RangeDopplerProcessor", "SPEED_OF_LIGHT"]
+
+SPEED_OF_LIGHT = 299792458.0
+
+_windows = {"hann": np.hanning,
+            "hamming": np.hamming,
+            "blackman": np.blackman,
+            None: np.ones}
+
+
+class RangeDopplerProcessor():
+    def __init__(self, config, range_fft_size=None, doppler_fft_size=None,
+                 range_window="hann", doppler_window="hann", remove_static=True):
+        """Create processor for frames acquired with config
+
+        Parameters:
+            config              device configuration dictionary
+            range_fft_size      FFT size over the samples of a chirp (default:
+                                num_samples_per_chirp); larger sizes zero pad
+            doppler_fft_size    FFT size over the chirps (default:
+                                num_chirps_per_frame)
+            range_window        window over the samples: "hann", "hamming",
+                                "blackman" or None
+            doppler_window      window over the chirps, see range_window
+            remove_static       if True, the mean over the chirps of every
+                                range bin (static targets) is removed before
+                                the Doppler FFT
+        """
+        self.config = dict(config)
+        self.num_rx = bin(config["rx_mask"]).count("1")
+        self.num_chirps = config["num_chirps_per_frame"]
+        self.num_samples = config["num_samples_per_chirp"]
+        self.range_fft_size = range_fft_size or self.num_samples
+        self.doppler_fft_size = doppler_fft_size or self.num_chirps
+        self.remove_static = remove_static
+        self.frame_shape = (self.num_rx, self.num_chirps, self.num_samples)
+
+        # windows normalized to unit sum, so a peak has the amplitude of its sinusoid
+        window = _windows[range_window](self.num_samples)
+        self.range_window = (window / window.sum()).astype(np.float32)
+        window = _windows[doppler_window](self.num_chirps)
+        self.doppler_window = (window / window.sum()).astype(np.float32)[:, np.newaxis]
+
+        bandwidth = config["upper_frequency_Hz"] - config["lower_frequency_Hz"]
+        center_frequency = (config["upper_frequency_Hz"] + config["lower_frequency_Hz"]) / 2
+        self.num_range_bins = self.range_fft_size // 2
+        self.range_resolution_m = SPEED_OF_LIGHT / (2 * bandwidth) * self.num_samples / self.range_fft_size
+        wavelength = SPEED_OF_LIGHT / center_frequency
+        self.velocity_resolution_m_s = wavelength / (
+            2 * self.doppler_fft_size * config["chirp_repetition_time_s"])
+
+    @classmethod
+    def from_device(cls, device, **kwargs):
+        """Create processor for the current configuration of device"""
+        return cls(device.get_config(), **kwargs)
+
+    @property
+    def range_axis(self):
+        """Range in meters of the range bins"""
+        return np.arange(self.num_range_bins) * self.range_resolution_m
+
+    @property
+    def velocity_axis(self):
+        """Radial velocity in m/s of the Doppler bins (after fftshift)"""
+        return (np.arange(self.doppler_fft_size) - self.doppler_fft_size // 2) * self.velocity_resolution_m_s
+
+    def _check(self, frames):
+        frames = np.asarray(frames)
+        if frames.shape[-3:] != self.frame_shape:
+            raise ValueError("Frames of shape {} do not match the configuration {}".format(
+                frames.shape[-3:], self.frame_shape))
+        return frames
+
+    def range_profiles(self, frames):
+        """Return complex range profiles (..., rx, chirps, range bins) of frames (..., rx, chirps, samples)
+
+        The mean of every chirp is removed, the chirp is windowed and the
+        positive range bins of its FFT are returned.
+        """
+        frames = self._check(frames).astype(np.float32)
+        frames -= frames.mean(axis=-1, keepdims=True)
+        frames *= self.range_window
+        return np.fft.rfft(frames, n=self.range_fft_size, axis=-1)[..., :self.num_range_bins]
+
+    def range_doppler(self, frames, magnitude=True, out=None):
+        """Return range-Doppler maps (..., rx, doppler bins, range bins) of frames
+
+        Zero velocity is in the center of the Doppler axis, see velocity_axis.
+
+        Parameters:
+            frames      array (..., rx, chirps, samples), e.g. one frame or
+                        a batch of frames
+            magnitude   if True, the magnitude is returned as float32;
+                        otherwise the complex map
+            out         optional array the result is written to
+        """
+        profiles = self.range_profiles(frames)
+        if self.remove_static:
+            profiles -= profiles.mean(axis=-2, keepdims=True)
+        profiles *= self.doppler_window
+        rd_map = np.fft.fftshift(np.fft.fft(profiles, n=self.doppler_fft_size, axis=-2), axes=-2)
+        if magnitude:
+            rd_map = np.abs(rd_map, out=np.empty(rd_map.shape, dtype=np.float32)
+                            if out is None else out)
+        elif out is not None:
+            out[...] = rd_map
+            rd_map = out
+        return rd_map
+
+    def range_profile(self, frames):
+        """Return the magnitude of the range profiles averaged over the chirps (..., rx, range bins)"""
+        return np.abs(self.range_profiles(frames)).mean(axis=-2)
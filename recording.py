@@ -0,0 +1,274 @@
+"""Append-only sharded recording of captured frames
+
+Saving every frame as its own .npy file creates one file (and inode) per
+frame and does not keep up with streaming capture at frame rate. ShardWriter
+buffers frames in memory and writes them as fixed-size shards:
+
+    shard-000000.npy    frames of the shard (count, num_rx, chirps, samples)
+    shard-000000.json   sidecar index: label and time stamp per frame,
+                        device uuid and device configuration
+
+Shards are written to temporary files, synced and renamed, and the sidecar
+index is written after its data. A shard is only valid if its index exists,
+so a crash never leaves a partly written shard behind; at most the frames
+still buffered in memory are lost. New writers continue the numbering of the
+shards in a directory, recordings are never overwritten.
+
+With a codec (see codec.QuantizedCodec), the frames are stored quantized,
+e.g. as int16. A codec without scale is fitted to every shard, so each shard
+has its own scale and offset in its index. read_shards decodes the frames.
+
+Example:
+    with ShardWriter("recordings/session1", device=device) as writer:
+        for frame in device.stream():
+            writer.append(frame.as_array(), "apple")
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from codec import QuantizedCodec
+
+__all__ = ["ShardWriter", "read_shards", "load_recording"]
+
+_version = 1
+_shard_pattern = re.compile(r"shard-(\d+)\.json$")
+
+
+def _write_atomic(path, write):
+    """Write a file through a synced temporary file and an atomic rename"""
+    tmp_path = str(path) + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _sync_directory(directory):
+    """Persist the renames in directory (not supported on Windows)"""
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _shard_numbers(directory):
+    return sorted(int(m.group(1)) for m in map(_shard_pattern.match, os.listdir(directory)) if m)
+
+
+class ShardWriter():
+    def __init__(self, directory, frame_shape=None, shard_size=256, dtype=np.float32,
+                 device=None, config=None, device_uuid=None, flush_interval_s=None,
+                 background=True, codec=None):
+        """Create writer appending frames to shards in directory
+
+        Parameters:
+            directory           directory of the recording, created if missing
+            frame_shape         shape of a frame; if None, it is taken from
+                                the configuration of device
+            shard_size          number of frames per shard
+            dtype               dtype the frames are stored with
+            device              optional Device the uuid and configuration
+                                are read from
+            config              device configuration stored in the index
+            device_uuid         device uuid stored in the index
+            flush_interval_s    if given, a shard is also written when its
+                                first frame is older than this (bounds the
+                                frames lost on a crash), also while no
+                                frames are appended (by a timer thread)
+            background          if True, shards are written on a background
+                                thread while the next shard is filled
+            codec               optional QuantizedCodec the frames are stored
+                                with; fitted per shard if it has no scale
+        """
+        if device is not None:
+            config = device.get_config() if config is None else config
+            device_uuid = device.get_shield_uuid() if device_uuid is None else device_uuid
+        if frame_shape is None:
+            if config is None:
+                raise ValueError("frame_shape or a device configuration is required")
+            frame_shape = (bin(config["rx_mask"]).count("1"),
+                           config["num_chirps_per_frame"], config["num_samples_per_chirp"])
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.frame_shape = tuple(frame_shape)
+        self.shard_size = shard_size
+        self.dtype = np.dtype(dtype)
+        self.config = config
+        self.device_uuid = device_uuid
+        self.flush_interval_s = flush_interval_s
+        self.codec = codec
+
+        numbers = _shard_numbers(self.directory)
+        self._next_shard = numbers[-1] + 1 if numbers else 0
+
+        # two buffers: one is filled while the other one is written
+        self._buffers = [np.empty((shard_size,) + self.frame_shape, dtype=self.dtype)
+                         for _ in range(2 if background else 1)]
+        self._buffer = self._buffers[0]
+        self._count = 0
+        self._labels = []
+        self._timestamps = []
+        self._first_append = None
+        self._timer = None
+
+        self._executor = ThreadPoolExecutor(max_workers=1) if background else None
+        self._pending = None
+        self._lock = threading.Lock()
+
+        self.frames_written = 0
+        self.shards_written = 0
+
+    def append(self, frame, label, timestamp=None):
+        """Append one frame
+
+        Parameters:
+            frame       array of shape frame_shape
+            label       label stored for the frame (e.g. the class name)
+            timestamp   time stamp in seconds since the epoch; if None, the
+                        current time is used
+        """
+        with self._lock:
+            if self._count == 0:
+                self._first_append = time.monotonic()
+                if self.flush_interval_s is not None:
+                    self._start_timer()
+            self._buffer[self._count] = frame
+            self._labels.append(label)
+            self._timestamps.append(time.time() if timestamp is None else timestamp)
+            self._count += 1
+
+            if self._count == self.shard_size or (
+                    self.flush_interval_s is not None
+                    and time.monotonic() - self._first_append >= self.flush_interval_s):
+                self._flush()
+
+    def extend(self, frames, label, timestamps=None):
+        """Append several frames (e.g. a burst) with the same label"""
+        for i, frame in enumerate(frames):
+            self.append(frame, label, None if timestamps is None else timestamps[i])
+
+    def _start_timer(self):
+        """Flush the shard started now after flush_interval_s, must hold the lock"""
+        self._timer = threading.Timer(self.flush_interval_s, self._timed_flush, (self._next_shard,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _timed_flush(self, number):
+        with self._lock:
+            # the shard might have been written in the meantime
+            if self._next_shard == number:
+                self._flush()
+
+    def _write_shard(self, number, data, index):
+        if self.codec is not None:
+            codec = self.codec if self.codec.scale is not None else self.codec.fit(data)
+            stored = codec.encode(data)
+            index["codec"] = dict(codec.to_dict(), max_error=codec.measure_error(data, stored))
+            data = stored
+        data_path = self.directory / "shard-{:06d}.npy".format(number)
+        index_path = self.directory / "shard-{:06d}.json".format(number)
+        _write_atomic(data_path, lambda f: np.save(f, data))
+        _write_atomic(index_path, lambda f: f.write(json.dumps(index).encode("utf-8")))
+        _sync_directory(self.directory)
+
+    def _wait_pending(self):
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+
+    def _flush(self):
+        """Write the buffered frames as shard, must hold the lock"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._count:
+            return
+        index = {"version": _version,
+                 "shard": self._next_shard,
+                 "count": self._count,
+                 "shape": list(self.frame_shape),
+                 "dtype": self.dtype.str,
+                 "device_uuid": self.device_uuid,
+                 "config": self.config,
+                 "labels": self._labels,
+                 "timestamps": self._timestamps}
+        data = self._buffer[:self._count]
+        number = self._next_shard
+
+        self._wait_pending()
+        if self._executor is not None:
+            self._pending = self._executor.submit(self._write_shard, number, data, index)
+            self._buffer = self._buffers[1] if self._buffer is self._buffers[0] else self._buffers[0]
+        else:
+            self._write_shard(number, data, index)
+
+        self.frames_written += self._count
+        self.shards_written += 1
+        self._next_shard += 1
+        self._count = 0
+        self._labels = []
+        self._timestamps = []
+
+    def flush(self):
+        """Write the buffered frames and wait until all shards are written"""
+        with self._lock:
+            self._flush()
+            self._wait_pending()
+
+    def close(self):
+        """Flush and stop the background thread"""
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_shards(directory, decode=True):
+    """Yield (frames, index) for every complete shard in directory
+
+    frames is a read-only memory map of the shard, index the sidecar
+    dictionary. Shards without index (interrupted writes) are skipped.
+
+    Parameters:
+        directory   directory of the recording
+        decode      if True, frames stored with a codec are decoded into a
+                    new array; otherwise the stored values are returned
+    """
+    directory = Path(directory)
+    for number in _shard_numbers(directory):
+        with open(directory / "shard-{:06d}.json".format(number)) as f:
+            index = json.load(f)
+        frames = np.load(directory / "shard-{:06d}.npy".format(number), mmap_mode="r")
+        if decode and "codec" in index:
+            frames = QuantizedCodec.from_dict(index["codec"]).decode(frames)
+        yield frames, index
+
+
+def load_recording(directory):
+    """Return (frames, labels, timestamps) of all shards in directory"""
+    frames, labels, timestamps = [], [], []
+    for data, index in read_shards(directory):
+        frames.append(data)
+        labels.extend(index["labels"])
+        timestamps.extend(index["timestamps"])
+    if not frames:
+        return None, np.array(labels), np.array(timestamps)
+    return np.concatenate(frames), np.array(labels), np.array(timestamps)
@@ -0,0 +1,440 @@
+"""Replay backend for ifxRadarSDK
+
+ReplayBackend implements the functions of the radar SDK library used by
+ifxRadarSDK in pure Python. Instead of reading from a radar device, it replays
+the frames recorded in the class folders of data/, new_data/ and
+new_new_data/ at the configured frame rate. Timeouts and FIFO overflows can be
+injected. This allows running and profiling the acquisition, feature
+extraction and classification code without a BGT60TR13C attached.
+
+Example:
+    import ifxRadarSDK
+    from simulator import ReplayBackend
+
+    ifxRadarSDK.set_backend(ReplayBackend())
+    with ifxRadarSDK.Device() as device:
+        ...
+"""
+
+import math
+import random
+import threading
+import time
+import uuid
+from ctypes import *
+from pathlib import Path
+
+import numpy as np
+
+from ifxError import error_mapping_exception
+from ifxRadarSDK import (DeviceConfigStruct, DeviceInfoStruct, DeviceListEntry,
+                         FirmwareInfoStruct, FrameStruct, MatrixRStruct, ShieldType)
+
+__all__ = ["ReplayBackend", "DEFAULT_ROOTS"]
+
+DEFAULT_ROOTS = ("data", "new_data", "new_new_data")
+
+_error_codes = dict((name, code) for code, name in error_mapping_exception.items())
+
+_speed_of_light = 299792458.0
+
+# metrics used for recording the dataset (see dataset_building.ipynb)
+_default_metrics = {
+    "sample_rate_Hz": 1000000,
+    "rx_mask": 7,
+    "tx_mask": 1,
+    "tx_power_level": 4,
+    "if_gain_dB": 40,
+    "range_resolution_m": 0.03,
+    "max_range_m": 0.8,
+    "max_speed_m_s": 2.84,
+    "speed_resolution_m_s": 0.089,
+    "frame_repetition_time_s": 0.1,
+    "center_frequency_Hz": 0,
+}
+
+_min_rf_frequency_Hz = 58000000000
+_max_rf_frequency_Hz = 63000000000
+_num_rx_antennas = 3
+
+
+def _next_pow2(x):
+    return 1 << max(0, math.ceil(math.log2(max(x, 1))))
+
+
+def _deref(arg):
+    """Return the structure behind a byref() or pointer() argument"""
+    if hasattr(arg, "_obj"):
+        return arg._obj
+    return arg.contents
+
+
+def _handle(arg):
+    """Return the integer value of a device handle"""
+    return arg.value if isinstance(arg, c_void_p) else arg
+
+
+class _DeviceState():
+    def __init__(self, uuid, position):
+        self.uuid = uuid
+        self.position = position  # index of the next replayed sample
+        self.config = DeviceConfigStruct()
+        self.acquiring = False
+        self.t_start = 0.0
+        self.num_read = 0
+        self.pending_errors = []
+        self.last_label = None
+        self.info = None
+        self.firmware = None
+
+
+class ReplayBackend():
+    def __init__(self, roots=DEFAULT_ROOTS, num_devices=1, frame_rate=None,
+                 realtime=True, fifo_frames=4, timeout_rate=0.0,
+                 overflow_rate=0.0, noise_std=0.0, shuffle=False, seed=0):
+        """Create backend replaying recorded frames
+
+        Each recorded sample has the shape (num_rx, num_samples) and holds one
+        chirp per antenna. The chirp is repeated for all chirps of a frame.
+        The samples are replayed in order (or shuffled) and the class of the
+        last replayed sample of a device is available from last_label().
+
+        If realtime is True, frames become available at the frame rate and a
+        reader that falls behind by more than fifo_frames frames gets a FIFO
+        overflow, just as with a real device. If realtime is False, frames
+        are returned as fast as possible.
+
+        Parameters:
+            roots           directories with class folders of .npy files;
+                            relative paths are relative to this file
+            num_devices     number of simulated devices
+            frame_rate      frame rate in Hz; if None, the frame repetition
+                            time of the device configuration is used
+            realtime        if True, frames are paced at the frame rate
+            fifo_frames     number of frames the device FIFO can hold
+            timeout_rate    probability of a timeout per frame
+            overflow_rate   probability of a FIFO overflow per frame
+            noise_std       standard deviation of noise added to the frames
+            shuffle         if True, samples are replayed in random order
+            seed            seed for shuffling, noise and error injection
+        """
+        base = Path(__file__).parent
+        self.roots = [Path(root) if Path(root).is_absolute() else base / root for root in roots]
+        self.frame_rate = frame_rate
+        self.realtime = realtime
+        self.fifo_frames = fifo_frames
+        self.timeout_rate = timeout_rate
+        self.overflow_rate = overflow_rate
+        self.noise_std = noise_std
+        self.shuffle = shuffle
+
+        self._random = random.Random(seed)
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._error = threading.local()
+
+        self._samples = None
+        self._labels = None
+        self._order = None
+
+        self._uuids = [uuid.UUID(int=i + 1).hex for i in range(num_devices)]
+        self._devices = {}
+        self._next_handle = 1
+        self._frames = {}
+        self._lists = {}
+
+    # helpers
+    def _set_error(self, name):
+        self._error.code = _error_codes[name]
+
+    def _load(self):
+        """Load all recorded samples, done once on first use"""
+        with self._lock:
+            if self._samples is not None:
+                return
+            files, labels = [], []
+            for root in self.roots:
+                for class_dir in sorted(p for p in root.iterdir() if p.is_dir()):
+                    for f in sorted(class_dir.glob("*.npy")):
+                        files.append(f)
+                        labels.append(class_dir.name)
+            if not files:
+                raise RuntimeError("No recorded frames found in {}".format(
+                    ", ".join(str(root) for root in self.roots)))
+            self._samples = np.stack([np.load(f) for f in files]).astype(np.float32)
+            self._labels = labels
+            self._order = np.arange(len(files))
+            if self.shuffle:
+                self._rng.shuffle(self._order)
+
+    def _frame_period(self, device):
+        if self.frame_rate:
+            return 1.0 / self.frame_rate
+        return device.config.frame_repetition_time_s
+
+    def _start(self, device):
+        if not device.acquiring:
+            self._load()
+            device.acquiring = True
+            device.t_start = time.monotonic()
+            device.num_read = 0
+
+    def _fill(self, device, data):
+        """Write the next recorded sample into data (num_rx, chirps, samples)"""
+        index = self._order[device.position % len(self._order)]
+        device.position += 1
+        sample = self._samples[index]
+        num_rx = min(data.shape[0], sample.shape[0])
+        num_samples = min(data.shape[2], sample.shape[1])
+        data.fill(0)
+        data[:num_rx, :, :num_samples] = sample[:num_rx, None, :num_samples]
+        if self.noise_std:
+            data += self._rng.normal(0.0, self.noise_std, data.shape).astype(np.float32)
+        device.last_label = self._labels[index]
+
+    def inject(self, error, uuid=None):
+        """Make the next get_next_frame call of a device fail
+
+        Parameters:
+            error   name of the error class, e.g. "ErrorTimeout" or
+                    "ErrorFifoOverflow"
+            uuid    device to inject the error; if None, all open devices
+        """
+        if error not in _error_codes:
+            raise ValueError("Unknown error " + error)
+        with self._lock:
+            for device in self._devices.values():
+                if uuid is None or device.uuid == uuid:
+                    device.pending_errors.append(error)
+
+    def last_label(self, uuid=None):
+        """Return the class of the last frame replayed by a device"""
+        for device in self._devices.values():
+            if uuid is None or device.uuid == uuid:
+                return device.last_label
+        return None
+
+    # sdk
+    def ifx_sdk_get_version_string(self):
+        return b"replay"
+
+    def ifx_sdk_get_version_string_full(self):
+        return b"replay (simulator.ReplayBackend)"
+
+    # error
+    def ifx_error_to_string(self, error):
+        return error_mapping_exception.get(error, "Unknown error {}".format(error)).encode("ascii")
+
+    def ifx_error_get_and_clear(self):
+        code = getattr(self._error, "code", 0)
+        self._error.code = 0
+        return code
+
+    # device
+    def _create(self, uuid):
+        with self._lock:
+            used = set(device.uuid for device in self._devices.values())
+            if uuid is None:
+                free = [u for u in self._uuids if u not in used]
+                uuid = free[0] if free else None
+            if uuid is None or uuid not in self._uuids:
+                self._set_error("ErrorNoDevice")
+                return None
+            if uuid in used:
+                self._set_error("ErrorDeviceBusy")
+                return None
+
+            device = _DeviceState(uuid, self._uuids.index(uuid) * 997)
+            self._translate(_default_metrics, device.config)
+            device.info = DeviceInfoStruct(b"BGT60TR13C (replay)",
+                                           _min_rf_frequency_Hz,
+                                           _max_rf_frequency_Hz,
+                                           1, _num_rx_antennas, 31, 1, 0,
+                                           int(ShieldType.BGT60TR13AIP))
+            device.firmware = FirmwareInfoStruct(b"replay firmware", 0, 0, 0, b"")
+            handle = self._next_handle
+            self._next_handle += 1
+            self._devices[handle] = device
+            return handle
+
+    def ifx_device_create(self):
+        return self._create(None)
+
+    def ifx_device_create_by_uuid(self, uuid):
+        return self._create(uuid.decode("ascii").replace("-", "").lower())
+
+    def ifx_device_create_by_port(self, port):
+        self._set_error("ErrorNoDevice")
+        return None
+
+    def ifx_device_destroy(self, handle):
+        with self._lock:
+            self._devices.pop(_handle(handle), None)
+
+    def ifx_device_register_list_string(self, handle, trigger):
+        return create_string_buffer(b"")
+
+    def ifx_mem_free(self, ptr):
+        pass
+
+    def ifx_device_get_list(self):
+        return self.ifx_device_get_list_by_shield_type(int(ShieldType.Any))
+
+    def ifx_device_get_list_by_shield_type(self, shield_type):
+        entries = []
+        if shield_type in (int(ShieldType.Any), int(ShieldType.BGT60TR13AIP)):
+            entries = [DeviceListEntry(int(ShieldType.BGT60TR13AIP), u.encode("ascii"))
+                       for u in self._uuids]
+        with self._lock:
+            handle = self._next_handle
+            self._next_handle += 1
+            self._lists[handle] = entries
+        return handle
+
+    def ifx_list_size(self, handle):
+        return len(self._lists[handle])
+
+    def ifx_list_get(self, handle, index):
+        return addressof(self._lists[handle][index])
+
+    def ifx_list_destroy(self, handle):
+        with self._lock:
+            self._lists.pop(handle, None)
+
+    def ifx_device_get_shield_uuid(self, handle):
+        return self._devices[_handle(handle)].uuid.encode("ascii")
+
+    def ifx_device_set_config(self, handle, config):
+        device = self._devices[_handle(handle)]
+        pointer(device.config)[0] = _deref(config)
+        device.acquiring = False
+        self._start(device)
+
+    def ifx_device_get_config(self, handle, config):
+        pointer(_deref(config))[0] = self._devices[_handle(handle)].config
+
+    def ifx_device_get_config_defaults(self, handle, config):
+        self._translate(_default_metrics, _deref(config))
+
+    def ifx_device_get_metrics_defaults(self, handle, metrics):
+        m = _deref(metrics)
+        for name, value in _default_metrics.items():
+            setattr(m, name, value)
+
+    def _translate(self, metrics, config):
+        get = metrics.get if isinstance(metrics, dict) else lambda name: getattr(metrics, name)
+        center = get("center_frequency_Hz") or (_min_rf_frequency_Hz + _max_rf_frequency_Hz) / 2
+        bandwidth = _speed_of_light / (2 * get("range_resolution_m"))
+        num_samples = _next_pow2(2 * get("max_range_m") / get("range_resolution_m"))
+        num_chirps = _next_pow2(2 * get("max_speed_m_s") / get("speed_resolution_m_s"))
+
+        config.sample_rate_Hz = int(get("sample_rate_Hz"))
+        config.rx_mask = get("rx_mask")
+        config.tx_mask = get("tx_mask")
+        config.tx_power_level = get("tx_power_level")
+        config.if_gain_dB = get("if_gain_dB")
+        config.lower_frequency_Hz = int(max(center - bandwidth / 2, _min_rf_frequency_Hz))
+        config.upper_frequency_Hz = int(min(center + bandwidth / 2, _max_rf_frequency_Hz))
+        config.num_samples_per_chirp = num_samples
+        config.num_chirps_per_frame = num_chirps
+        config.chirp_repetition_time_s = _speed_of_light / center / (4 * get("max_speed_m_s"))
+        config.frame_repetition_time_s = get("frame_repetition_time_s")
+        config.mimo_mode = 0
+
+    def ifx_device_translate_metrics_to_config(self, handle, metrics, config):
+        self._translate(_deref(metrics), _deref(config))
+
+    def ifx_device_start_acquisition(self, handle):
+        self._start(self._devices[_handle(handle)])
+        return True
+
+    def ifx_device_stop_acquisition(self, handle):
+        self._devices[_handle(handle)].acquiring = False
+        return True
+
+    def ifx_device_create_frame_from_device_handle(self, handle):
+        config = self._devices[_handle(handle)].config
+        num_rx = bin(config.rx_mask).count("1")
+        return self.ifx_frame_create_r(num_rx, config.num_chirps_per_frame,
+                                       config.num_samples_per_chirp)
+
+    def ifx_device_get_next_frame(self, handle, frame):
+        return self._get_next_frame(handle, frame, None)
+
+    def ifx_device_get_next_frame_timeout(self, handle, frame, timeout_ms):
+        return self._get_next_frame(handle, frame, timeout_ms)
+
+    def _get_next_frame(self, handle, frame, timeout_ms):
+        device = self._devices[_handle(handle)]
+        self._start(device)
+
+        error = None
+        if device.pending_errors:
+            error = device.pending_errors.pop(0)
+        elif self.overflow_rate and self._random.random() < self.overflow_rate:
+            error = "ErrorFifoOverflow"
+        elif self.timeout_rate and self._random.random() < self.timeout_rate:
+            error = "ErrorTimeout"
+
+        period = self._frame_period(device)
+        if self.realtime and error is None:
+            now = time.monotonic()
+            available = int((now - device.t_start) / period)
+            if available - device.num_read > self.fifo_frames:
+                error = "ErrorFifoOverflow"
+            else:
+                wait = device.t_start + (device.num_read + 1) * period - now
+                if timeout_ms and wait > timeout_ms / 1000:
+                    time.sleep(timeout_ms / 1000)
+                    return _error_codes["ErrorTimeout"]
+                if wait > 0:
+                    time.sleep(wait)
+
+        if error == "ErrorFifoOverflow":
+            # the device stops the acquisition on overflow
+            device.acquiring = False
+            return _error_codes[error]
+        if error is not None:
+            if self.realtime and error == "ErrorTimeout" and timeout_ms:
+                time.sleep(timeout_ms / 1000)
+            return _error_codes[error]
+
+        self._fill(device, self._frames[addressof(frame.contents)])
+        device.num_read += 1
+        return 0
+
+    def ifx_device_get_temperature(self, handle, temperature):
+        device = self._devices[_handle(handle)]
+        _deref(temperature).value = 25.0 + 0.01 * device.num_read * self._frame_period(device)
+
+    def ifx_device_get_firmware_information(self, handle):
+        return pointer(self._devices[_handle(handle)].firmware)
+
+    def ifx_device_get_device_information(self, handle):
+        return pointer(self._devices[_handle(handle)].info)
+
+    # frame
+    def ifx_frame_create_r(self, num_antennas, num_chirps_per_frame, num_samples_per_chirp):
+        data = np.zeros((num_antennas, num_chirps_per_frame, num_samples_per_chirp), dtype=np.float32)
+        mats = [MatrixRStruct(data[antenna].ctypes.data_as(POINTER(c_float)),
+                              num_chirps_per_frame, num_samples_per_chirp,
+                              num_samples_per_chirp, 0)
+                for antenna in range(num_antennas)]
+        mat_pointers = (POINTER(MatrixRStruct) * num_antennas)(*[pointer(mat) for mat in mats])
+        frame = FrameStruct(num_antennas, cast(mat_pointers, POINTER(POINTER(MatrixRStruct))))
+        frame_p = pointer(frame)
+        # keep everything alive until the frame is destroyed
+        frame._keep = (data, mats, mat_pointers)
+        with self._lock:
+            self._frames[addressof(frame)] = data
+            self._frames[("frame", addressof(frame))] = frame
+        return frame_p
+
+    def ifx_frame_destroy_r(self, frame):
+        address = addressof(frame.contents)
+        with self._lock:
+            self._frames.pop(address, None)
+            self._frames.pop(("frame", address), None)
+
+    def ifx_frame_get_mat_from_antenna_r(self, frame, antenna):
+        return frame.contents.rx_data[antenna]
@@ -0,0 +1,271 @@
+"""Streaming normalization statistics
+
+train.ipynb and 1d_train.ipynb transform the whole corpus into memory only to
+take its minimum and maximum. StreamingStats computes minimum, maximum, mean
+and variance (Welford's algorithm, merged per chunk with Chan's formula) and
+quantiles from a reservoir sample in one pass over chunks, with memory
+independent of the number of samples.
+
+The statistics are kept per position of the axes given by keep_axes, e.g.
+per antenna of raw samples (num_rx, num_samples) or per frequency bin and
+antenna of spectrogram features (time, frequency, num_rx), and reduced over
+all other axes. compute_stats runs the pass over a PackedDataset and stores
+the result as .npz file, which is reused as long as the dataset and the
+parameters do not change (the dataset is identified by its path, sample
+count, codec and a fingerprint of its files, so a dataset repacked in place
+is detected).
+
+Example:
+    engine = SpectrogramEngine(n_fft=64, win_length=12, freq_crop=10)
+    stats = compute_stats(PackedDataset("packed/new_new_data"), "stats.npz",
+                          transform=engine.transform, params=engine.params,
+                          keep_axes=(1, 2))
+    optimize_mx = math.floor(math.sqrt(stats.max.max())) - 1
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+__all__ = ["StreamingStats", "compute_stats"]
+
+_version = 1
+
+
+class StreamingStats():
+    def __init__(self, keep_axes=(0,), reservoir_size=4096, seed=0):
+        """Create empty statistics
+
+        Parameters:
+            keep_axes       axes of a sample the statistics are kept for; all
+                            other axes are reduced
+            reservoir_size  number of values kept per position for quantiles
+                            (0 disables quantiles)
+            seed            seed of the reservoir sampling
+        """
+        self.keep_axes = tuple(keep_axes)
+        self.reservoir_size = reservoir_size
+        self.seed = seed
+        self._rng = np.random.default_rng(seed)
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+        self.min = None
+        self.max = None
+        self.reservoir = None
+        self.seen = 0
+
+    def _values(self, batch):
+        """Return batch as (values, positions) with the kept axes last"""
+        batch = np.asarray(batch)
+        keep = [axis % (batch.ndim - 1) + 1 for axis in self.keep_axes]
+        reduce = [axis for axis in range(batch.ndim) if axis not in keep]
+        values = np.transpose(batch, reduce + keep)
+        kept_shape = values.shape[len(reduce):]
+        return values.reshape((-1,) + kept_shape), kept_shape
+
+    def update(self, batch):
+        """Add a batch of samples (N, *sample shape)"""
+        values, kept_shape = self._values(batch)
+        if not len(values):
+            return self
+        values64 = values.astype(np.float64)
+        other = StreamingStats(self.keep_axes, 0)
+        other.count = len(values)
+        other.mean = values64.mean(axis=0)
+        other.m2 = ((values64 - other.mean) ** 2).sum(axis=0)
+        other.min = values.min(axis=0)
+        other.max = values.max(axis=0)
+        self._merge_moments(other)
+        if self.reservoir_size:
+            self._sample(values, kept_shape)
+        return self
+
+    def _merge_moments(self, other):
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / count)
+        self.m2 = self.m2 + other.m2 + delta ** 2 * (self.count * other.count / count)
+        self.count = count
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+
+    def _sample(self, values, kept_shape):
+        """Reservoir sampling (algorithm R) of the rows of values, vectorized"""
+        if self.reservoir is None:
+            self.reservoir = np.empty((self.reservoir_size,) + kept_shape, dtype=values.dtype)
+        fill = min(len(values), max(0, self.reservoir_size - self.seen))
+        self.reservoir[self.seen:self.seen + fill] = values[:fill]
+        rest = values[fill:]
+        if len(rest):
+            # the i-th value seen replaces a random slot with probability k / i
+            seen = self.seen + fill + np.arange(1, len(rest) + 1)
+            slots = (self._rng.random(len(rest)) * seen).astype(np.int64)
+            accepted = slots < self.reservoir_size
+            # later values overwrite earlier ones, as in the sequential algorithm
+            self.reservoir[slots[accepted]] = rest[accepted]
+        self.seen += len(values)
+
+    def merge(self, other):
+        """Merge the statistics of another StreamingStats (e.g. of another worker)
+
+        The reservoirs are merged by sampling both in proportion to the
+        number of values they represent.
+        """
+        if other.count == 0:
+            return self
+        self._merge_moments(other)
+        if self.reservoir_size and other.reservoir is not None:
+            own = (self.reservoir[:min(self.seen, self.reservoir_size)]
+                   if self.reservoir is not None else other.reservoir[:0])
+            theirs = other.reservoir[:min(other.seen, other.reservoir_size)]
+            total = len(own) + len(theirs)
+            take = min(self.reservoir_size, total)
+            # every kept value represents seen / kept values of its reservoir
+            weights = np.concatenate([np.full(len(own), self.seen / max(len(own), 1)),
+                                      np.full(len(theirs), other.seen / max(len(theirs), 1))])
+            chosen = self._rng.choice(total, size=take, replace=False, p=weights / weights.sum())
+            merged = np.concatenate([own, theirs])[chosen]
+            self.reservoir = np.empty((self.reservoir_size,) + merged.shape[1:], dtype=merged.dtype)
+            self.reservoir[:take] = merged
+        self.seen += other.seen
+        return self
+
+    @property
+    def var(self):
+        """Population variance per position"""
+        return self.m2 / self.count if self.count else None
+
+    @property
+    def std(self):
+        """Population standard deviation per position"""
+        return np.sqrt(self.var) if self.count else None
+
+    def quantile(self, q):
+        """Return the estimated q-quantile(s) per position from the reservoir"""
+        if self.reservoir is None:
+            raise ValueError("No reservoir, quantiles are not available")
+        return np.quantile(self.reservoir[:min(self.seen, self.reservoir_size)], q, axis=0)
+
+    def save(self, path, source=None):
+        """Write the statistics to the .npz file path
+
+        Parameters:
+            path    file name
+            source  JSON serializable description of the data the statistics
+                    were computed from, see compute_stats
+        """
+        meta = {"version": _version,
+                "keep_axes": list(self.keep_axes),
+                "reservoir_size": self.reservoir_size,
+                "seed": self.seed,
+                "count": self.count,
+                "seen": self.seen,
+                "source": source}
+        arrays = dict(mean=self.mean, m2=self.m2, min=self.min, max=self.max)
+        if self.reservoir is not None:
+            arrays["reservoir"] = self.reservoir[:min(self.seen, self.reservoir_size)]
+        tmp_path = str(path) + ".tmp.npz"
+        np.savez(tmp_path, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read statistics written by save, returns (stats, source)"""
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta["version"] != _version:
+                raise ValueError("Unsupported statistics version {}".format(meta["version"]))
+            stats = cls(meta["keep_axes"], meta["reservoir_size"], meta["seed"])
+            stats.count = meta["count"]
+            stats.seen = meta["seen"]
+            stats.mean, stats.m2 = data["mean"], data["m2"]
+            stats.min, stats.max = data["min"], data["max"]
+            if "reservoir" in data:
+                reservoir = data["reservoir"]
+                stats.reservoir = np.empty((stats.reservoir_size,) + reservoir.shape[1:],
+                                           dtype=reservoir.dtype)
+                stats.reservoir[:len(reservoir)] = reservoir
+        return stats, meta["source"]
+
+    def to_dict(self, quantiles=(0.001, 0.5, 0.999)):
+        """Return the statistics as dictionary of lists (e.g. for printing)"""
+        result = {"count": self.count,
+                  "min": self.min.tolist(),
+                  "max": self.max.tolist(),
+                  "mean": self.mean.tolist(),
+                  "std": self.std.tolist()}
+        if self.reservoir is not None:
+            for q in quantiles:
+                result["q{:g}".format(q)] = self.quantile(q).tolist()
+        return result
+
+
+def _fingerprint(dataset):
+    """Return a fingerprint of the files of a PackedDataset
+
+    Size and modification time of samples.npy (too large to hash on every
+    call) and the blake2b digest of ids.npy and meta.json.
+    """
+    path = Path(dataset.path)
+    stat = (path / "samples.npy").stat()
+    h = hashlib.blake2b(digest_size=16)
+    for name in ("ids.npy", "meta.json"):
+        with open(path / name, "rb") as f:
+            h.update(f.read())
+    return {"samples_size": stat.st_size,
+            "samples_mtime_ns": stat.st_mtime_ns,
+            "digest": h.hexdigest()}
+
+
+def compute_stats(dataset, path=None, transform=None, params=None, keep_axes=(0,),
+                  chunk_size=1024, reservoir_size=4096):
+    """Return StreamingStats of a PackedDataset, reusing the file path if it is current
+
+    The dataset is read in chunks of chunk_size samples, each chunk is
+    transformed (e.g. by SpectrogramEngine.transform) and added to the
+    statistics. If path exists and was computed from the same dataset
+    (path, sample count, codec and file fingerprint) with the same params,
+    keep_axes and reservoir_size, it is loaded instead.
+
+    Parameters:
+        dataset         PackedDataset
+        path            optional .npz file the statistics are stored in
+        transform       optional function applied to every chunk of samples
+        params          JSON serializable parameters of transform, required
+                        with transform (they identify the stored statistics)
+        keep_axes       axes of a (transformed) sample the statistics are
+                        kept for, see StreamingStats
+        chunk_size      number of samples per chunk
+        reservoir_size  number of values kept per position for quantiles
+    """
+    if transform is not None and params is None:
+        raise ValueError("params are required to identify the statistics of transform")
+    source = {"dataset": str(Path(dataset.path).resolve()),
+              "count": len(dataset),
+              "codec": dataset.meta.get("codec"),
+              "fingerprint": _fingerprint(dataset),
+              "params": params,
+              "keep_axes": list(keep_axes),
+              "reservoir_size": reservoir_size}
+    # normalize through JSON, as the stored source is compared after loading
+    source = json.loads(json.dumps(source))
+    if path is not None and Path(path).exists():
+        stats, stored_source = StreamingStats.load(path)
+        if stored_source == source:
+            return stats
+
+    stats = StreamingStats(keep_axes, reservoir_size)
+    for start in range(0, len(dataset), chunk_size):
+        chunk = dataset.read(slice(start, start + chunk_size))
+        stats.update(transform(chunk) if transform is not None else chunk)
+    if path is not None:
+        stats.save(path, source)
+    return stats
@@ -0,0 +1,177 @@
+"""Sweep of the spectrogram parameters
+
+The notebooks use different hand-picked spectrogram settings (n_fft=64,
+win_length=12, 10 frequency bins in train.ipynb; n_fft=32, win_length=24,
+3 frequency bins and scale 5 in xgb.ipynb). run_sweep evaluates a grid of
+settings on a packed dataset (see dataset.pack_dataset) and reports the
+accuracy and the feature extraction time of every setting.
+
+Settings with the same (n_fft, win_length, hop_length) share one float
+spectrogram, only the crop, scale and cast are computed per setting. Every
+such group is evaluated in a worker process which memory maps the packed
+dataset, so the raw data is read once from the page cache instead of being
+copied to the workers.
+
+The default evaluator trains the XGBoost classifier of xgb.ipynb. Any
+picklable function evaluator(X_train, y_train, X_test, y_test) returning
+the accuracy can be used instead.
+
+Command line:
+    python sweep.py DATASET [--n-fft 32 64] [--win-length 12 24] [--hop-length 0]
+                            [--freq-crop 3 10] [--scale 0 5] [--workers N] [--json FILE]
+"""
+
+import argparse
+import itertools
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dataset import PackedDataset
+from features import SpectrogramEngine
+
+__all__ = ["run_sweep", "expand_grid", "xgboost_evaluator", "split_indices", "DEFAULT_GRID"]
+
+# hop_length and scale None: default hop (win_length // 2) and no scaling
+DEFAULT_GRID = {"n_fft": [32, 64],
+                "win_length": [12, 24],
+                "hop_length": [None],
+                "freq_crop": [3, 10],
+                "scale": [None, 5]}
+
+_group_keys = ("n_fft", "win_length", "hop_length")
+
+
+def expand_grid(grid):
+    """Return the list of settings (dictionaries) of a grid of parameter lists
+
+    Settings with win_length > n_fft are skipped.
+    """
+    names = sorted(grid)
+    settings = [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+    return [s for s in settings if s["win_length"] <= s["n_fft"]]
+
+
+def split_indices(n, test_size=0.2, seed=123):
+    """Return (train, test) index arrays of a random split of n samples"""
+    permutation = np.random.default_rng(seed).permutation(n)
+    n_test = int(round(n * test_size))
+    return np.sort(permutation[n_test:]), np.sort(permutation[:n_test])
+
+
+def xgboost_evaluator(X_train, y_train, X_test, y_test):
+    """Train the XGBoost classifier of xgb.ipynb on flattened features and return the accuracy
+
+    The notebook passes objective='merror', which is an evaluation metric and
+    not an objective; it is used as eval_metric with the default multi-class
+    objective.
+    """
+    import xgboost as xgb
+
+    classifier = xgb.XGBClassifier(max_depth=30, reg_alpha=10, n_estimators=100, eval_metric="merror")
+    classifier.fit(X_train.reshape(len(X_train), -1), y_train)
+    predictions = classifier.predict(X_test.reshape(len(X_test), -1))
+    return float(np.mean(predictions == y_test))
+
+
+def _run_group(dataset_path, settings, train_index, test_index, evaluator, backend):
+    """Evaluate settings sharing (n_fft, win_length, hop_length) in a worker"""
+    dataset = PackedDataset(dataset_path)
+    X = dataset.read()
+    y = np.asarray(dataset.labels)
+
+    engines = [SpectrogramEngine(s["n_fft"], s["win_length"], s["hop_length"], s["freq_crop"],
+                                 s["scale"], backend=backend) for s in settings]
+    t_start = time.perf_counter()
+    spec = engines[0].spectrogram(X)
+    spectrogram_s = time.perf_counter() - t_start
+
+    results = []
+    for setting, engine in zip(settings, engines):
+        t_start = time.perf_counter()
+        features = engine.from_spectrogram(spec)
+        features_s = time.perf_counter() - t_start
+        t_start = time.perf_counter()
+        accuracy = evaluator(features[train_index], y[train_index], features[test_index], y[test_index])
+        results.append(dict(setting,
+                            accuracy=accuracy,
+                            feature_shape=list(features.shape[1:]),
+                            # the spectrogram is computed once for the group
+                            spectrogram_s=spectrogram_s,
+                            features_s=features_s,
+                            extraction_us_per_sample=1e6 * (spectrogram_s + features_s) / len(X),
+                            evaluate_s=time.perf_counter() - t_start))
+    return results
+
+
+def run_sweep(dataset_path, grid=DEFAULT_GRID, evaluator=xgboost_evaluator, max_workers=None,
+              test_size=0.2, seed=123, backend="numpy"):
+    """Evaluate all settings of grid and return the results sorted by accuracy
+
+    Parameters:
+        dataset_path    directory of a packed dataset
+        grid            dictionary of lists of n_fft, win_length, hop_length,
+                        freq_crop and scale values
+        evaluator       picklable function (X_train, y_train, X_test, y_test)
+                        returning the accuracy
+        max_workers     number of worker processes (default: number of CPUs);
+                        0 evaluates in this process
+        test_size       fraction of samples used for testing
+        seed            seed of the train/test split
+        backend         spectrogram backend, see SpectrogramEngine
+    """
+    settings = expand_grid(grid)
+    groups = {}
+    for setting in settings:
+        groups.setdefault(tuple(setting[k] for k in _group_keys), []).append(setting)
+    train_index, test_index = split_indices(len(PackedDataset(dataset_path)), test_size, seed)
+    args = [(str(dataset_path), group, train_index, test_index, evaluator, backend)
+            for group in groups.values()]
+
+    results = []
+    if max_workers == 0:
+        for arg in args:
+            results.extend(_run_group(*arg))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for group_results in executor.map(_run_group, *zip(*args)):
+                results.extend(group_results)
+    return sorted(results, key=lambda r: r["accuracy"], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep of the spectrogram parameters")
+    parser.add_argument("dataset", help="directory of a packed dataset")
+    parser.add_argument("--n-fft", type=int, nargs="+", default=DEFAULT_GRID["n_fft"])
+    parser.add_argument("--win-length", type=int, nargs="+", default=DEFAULT_GRID["win_length"])
+    parser.add_argument("--hop-length", type=int, nargs="+", default=[0], help="0: win_length // 2")
+    parser.add_argument("--freq-crop", type=int, nargs="+", default=DEFAULT_GRID["freq_crop"])
+    parser.add_argument("--scale", type=float, nargs="+", default=[0, 5], help="0: no scaling")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    grid = {"n_fft": args.n_fft,
+            "win_length": args.win_length,
+            "hop_length": [h or None for h in args.hop_length],
+            "freq_crop": args.freq_crop,
+            "scale": [s or None for s in args.scale]}
+    t_start = time.perf_counter()
+    results = run_sweep(args.dataset, grid, max_workers=args.workers)
+
+    print("{:>6} {:>6} {:>6} {:>6} {:>6} {:>9} {:>12}".format(
+        "n_fft", "win", "hop", "crop", "scale", "accuracy", "extract [us]"))
+    for r in results:
+        print("{:>6} {:>6} {:>6} {:>6} {:>6} {:>9.3f} {:>12.1f}".format(
+            r["n_fft"], r["win_length"], str(r["hop_length"]), r["freq_crop"], str(r["scale"]),
+            r["accuracy"], r["extraction_us_per_sample"]))
+    print("{} settings in {:.1f} s".format(len(results), time.perf_counter() - t_start))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""Telemetry of the acquisition path
+
+AcquisitionTelemetry collects read latency and inter-arrival time histograms,
+gaps in the frame sequence, SDK errors such as FIFO overflows and the device
+temperature. It is attached to a device with Device.set_telemetry and
+exported periodically through a sink:
+
+    MemorySink          keeps the snapshots in memory
+    JsonLinesSink       appends one JSON line per snapshot to a file
+    PrometheusTextSink  writes the Prometheus text format to a file (e.g. for
+                        the textfile collector of the node exporter)
+
+Example:
+    telemetry = AcquisitionTelemetry(sink=JsonLinesSink("telemetry.jsonl"),
+                                     export_interval_s=10)
+    device.set_telemetry(telemetry)
+    for frame in device.stream():
+        ...
+"""
+
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter
+
+__all__ = ["Histogram", "AcquisitionTelemetry", "MemorySink", "JsonLinesSink",
+           "PrometheusTextSink", "LATENCY_BOUNDS_S"]
+
+# bucket upper bounds in seconds, from 100 us to 10 s
+LATENCY_BOUNDS_S = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02,
+                    0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+
+class Histogram():
+    def __init__(self, bounds=LATENCY_BOUNDS_S):
+        """Create histogram with fixed buckets
+
+        A value v is counted in the first bucket with v <= bound. Values
+        larger than the last bound are counted in an additional overflow
+        bucket.
+
+        Parameters:
+            bounds      increasing upper bounds of the buckets
+        """
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value):
+        """Add value to the histogram"""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Return upper bound of the bucket containing the q-quantile
+
+        The result is exact up to the bucket resolution. Returns None for an
+        empty histogram and max for quantiles in the overflow bucket.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        """Return histogram as dictionary"""
+        empty = not self.count
+        return {"bounds": list(self.bounds),
+                "counts": list(self.counts),
+                "count": self.count,
+                "sum": self.sum,
+                "min": None if empty else self.min,
+                "max": None if empty else self.max,
+                "p50": self.quantile(0.5),
+                "p99": self.quantile(0.99)}
+
+
+class AcquisitionTelemetry():
+    def __init__(self, frame_period_s=None, temperature_interval_s=10.0,
+                 sink=None, export_interval_s=None, labels=None, blocked_fraction=0.25):
+        """Create telemetry for the acquisition of one device
+
+        Frames are counted as missed only when the device FIFO was empty: a
+        read that blocks for at least blocked_fraction of a frame period
+        returned a frame that arrived during the read. Between two blocked
+        reads round(dt / frame_period_s) frames were produced by the device;
+        if fewer frames were received in between, the difference is counted
+        as missed frames and the sequence number advances by it (one gap).
+        The count is confirmed by the next blocked read, so it lags by one
+        blocked read and frames missed just before the acquisition stops
+        are not counted.
+        Frames a slow consumer reads from the FIFO are not counted as
+        missed. Device.set_telemetry sets frame_period_s from the device
+        configuration if it is not given. The time between reads is kept
+        in the inter_arrival histogram (jitter).
+
+        Parameters:
+            frame_period_s          expected time between frames in seconds
+            temperature_interval_s  interval for reading the temperature; if
+                                    None, the temperature is not read
+            sink                    sink used by export()
+            export_interval_s       if given, export() is called
+                                    automatically in this interval
+            labels                  dictionary of labels added to the
+                                    snapshots, e.g. {"device": uuid}
+            blocked_fraction        minimum read latency, as fraction of
+                                    frame_period_s, of a read that waited
+                                    for its frame
+        """
+        self.frame_period_s = frame_period_s
+        self.temperature_interval_s = temperature_interval_s
+        self.sink = sink
+        self.export_interval_s = export_interval_s
+        self.labels = dict(labels or {})
+        self.blocked_fraction = blocked_fraction
+
+        self._lock = threading.Lock()
+        self.read_latency = Histogram()
+        self.inter_arrival = Histogram()
+        self.frames = 0
+        self.sequence = -1
+        self.gaps = 0
+        self.missed_frames = 0
+        self.errors = Counter()
+        self.temperature = None
+
+        self._last_arrival = None
+        self._last_blocked = None
+        self._since_blocked = 0
+        self._pending_missed = 0
+        self._next_temperature = 0.0
+        self._next_export = None
+
+    def restart(self):
+        """Mark a restart of the acquisition
+
+        The time between stopping and restarting the acquisition is not
+        counted as gap.
+        """
+        with self._lock:
+            self._last_arrival = None
+            self._last_blocked = None
+            self._since_blocked = 0
+            self._pending_missed = 0
+
+    def record_frame(self, t_start, t_end):
+        """Record a frame read between t_start and t_end (time.monotonic)"""
+        with self._lock:
+            self.frames += 1
+            self.read_latency.observe(t_end - t_start)
+            if self._last_arrival is not None:
+                self.inter_arrival.observe(t_end - self._last_arrival)
+            self._last_arrival = t_end
+
+            self.sequence += 1
+            self._since_blocked += 1
+            if self.frame_period_s and t_end - t_start >= self.blocked_fraction * self.frame_period_s:
+                # the FIFO was empty: the frame was produced during the read
+                if self._last_blocked is not None:
+                    produced = round((t_end - self._last_blocked) / self.frame_period_s)
+                    missed = produced - self._since_blocked
+                    # a late return of the previous blocked read makes this
+                    # interval one frame too long and the next one one frame
+                    # too short, so missed frames are only counted when the
+                    # next interval does not compensate them
+                    confirmed = max(0, self._pending_missed + min(missed, 0))
+                    self._pending_missed = max(missed, 0)
+                    if confirmed:
+                        self.gaps += 1
+                        self.missed_frames += confirmed
+                        self.sequence += confirmed
+                self._last_blocked = t_end
+                self._since_blocked = 0
+        self._maybe_export(t_end)
+
+    def record_error(self, name):
+        """Record an SDK error given by the name of its exception class"""
+        with self._lock:
+            self.errors[name] += 1
+
+    def temperature_due(self, now):
+        """Return True if the temperature should be read"""
+        return self.temperature_interval_s is not None and now >= self._next_temperature
+
+    def record_temperature(self, temperature, now=None):
+        """Record the device temperature in degrees Celsius"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.temperature = temperature
+            self._next_temperature = now + (self.temperature_interval_s or 0.0)
+
+    def snapshot(self):
+        """Return the current state as dictionary"""
+        with self._lock:
+            return {"time": time.time(),
+                    "labels": dict(self.labels),
+                    "frames": self.frames,
+                    "sequence": self.sequence,
+                    "gaps": self.gaps,
+                    "missed_frames": self.missed_frames,
+                    "fifo_overflows": self.errors["ErrorFifoOverflow"],
+                    "errors": dict(self.errors),
+                    "temperature_c": self.temperature,
+                    "read_latency_s": self.read_latency.to_dict(),
+                    "inter_arrival_s": self.inter_arrival.to_dict()}
+
+    def export(self):
+        """Write a snapshot to the sink and return the snapshot"""
+        snapshot = self.snapshot()
+        if self.sink is not None:
+            self.sink.write(snapshot)
+        return snapshot
+
+    def _maybe_export(self, now):
+        if self.export_interval_s is None:
+            return
+        if self._next_export is None:
+            self._next_export = now + self.export_interval_s
+        elif now >= self._next_export:
+            self._next_export = now + self.export_interval_s
+            self.export()
+
+
+class MemorySink():
+    def __init__(self, max_snapshots=None):
+        """Keep snapshots in memory
+
+        Parameters:
+            max_snapshots   number of snapshots kept; if None, all are kept
+        """
+        self.max_snapshots = max_snapshots
+        self.snapshots = []
+
+    @property
+    def last(self):
+        """Most recent snapshot or None"""
+        return self.snapshots[-1] if self.snapshots else None
+
+    def write(self, snapshot):
+        self.snapshots.append(snapshot)
+        if self.max_snapshots is not None:
+            del self.snapshots[:-self.max_snapshots]
+
+
+class JsonLinesSink():
+    def __init__(self, path):
+        """Append every snapshot as one JSON line to the file path"""
+        self.path = path
+
+    def write(self, snapshot):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(snapshot) + "\n")
+
+
+class PrometheusTextSink():
+    def __init__(self, path, prefix="radar"):
+        """Write the latest snapshot in the Prometheus text format
+
+        The file is replaced atomically, so a collector never reads a partly
+        written file.
+
+        Parameters:
+            path        file to write
+            prefix      prefix of the metric names
+        """
+        self.path = path
+        self.prefix = prefix
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join('{}="{}"'.format(k, v) for k, v in sorted(labels.items())) + "}"
+
+    def format(self, snapshot):
+        """Return snapshot in the Prometheus text format"""
+        labels = snapshot["labels"]
+        lines = []
+
+        def metric(name, kind, value, extra=None):
+            lines.append("# TYPE {}_{} {}".format(self.prefix, name, kind))
+            lines.append("{}_{}{} {}".format(self.prefix, name,
+                                             self._labels(dict(labels, **(extra or {}))), value))
+
+        metric("frames_total", "counter", snapshot["frames"])
+        metric("frame_gaps_total", "counter", snapshot["gaps"])
+        metric("missed_frames_total", "counter", snapshot["missed_frames"])
+        metric("fifo_overflows_total", "counter", snapshot["fifo_overflows"])
+        if snapshot["temperature_c"] is not None:
+            metric("temperature_celsius", "gauge", snapshot["temperature_c"])
+
+        name = "{}_errors_total".format(self.prefix)
+        lines.append("# TYPE {} counter".format(name))
+        for error, count in sorted(snapshot["errors"].items()):
+            lines.append("{}{} {}".format(name, self._labels(dict(labels, error=error)), count))
+
+        for key in ("read_latency_s", "inter_arrival_s"):
+            histogram = snapshot[key]
+            name = "{}_{}_seconds".format(self.prefix, key[:-len("_s")])
+            lines.append("# TYPE {} histogram".format(name))
+            cumulative = 0
+            for bound, count in zip(histogram["bounds"] + ["+Inf"], histogram["counts"]):
+                cumulative += count
+                lines.append("{}_bucket{} {}".format(
+                    name, self._labels(dict(labels, le=bound)), cumulative))
+            lines.append("{}_sum{} {}".format(name, self._labels(labels), histogram["sum"]))
+            lines.append("{}_count{} {}".format(name, self._labels(labels), histogram["count"]))
+        return "\n".join(lines) + "\n"
+
+    def write(self, snapshot):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.format(snapshot))
+        os.replace(tmp_path, self.path)